@@ -1,26 +1,65 @@
+import os
+
 import login
-import config
 import setting
+from cache import FileCache
+from context import AccountContext, get_account
 from error import CookieError
-from loghelper import log
-from request import get_new_session
+
+# 绑定的游戏账号很少变化，默认缓存 7 天，可通过环境变量 AutoMihoyoBBS_account_cache_ttl 设置（单位：天，0 为不缓存）
+account_cache_ttl = int(os.getenv("AutoMihoyoBBS_account_cache_ttl", "7")) * 86400
+account_cache = FileCache("account_list", account_cache_ttl)
+
+
+def get_cache_key(game_id: str, account: AccountContext = None):
+    '''
+    获取账号列表的缓存 key
+
+    :param game_id: 游戏ID
+    :param account: 账号上下文，默认为当前账号
+
+    :return: 米游社 uid:游戏ID，cookie 中没有 uid 时返回 None
+    '''
+    uid = login.get_uid(account)
+    if uid is None:
+        return None
+    return f"{uid}:{game_id}"
 
 
-def get_account_list(game_id: str, headers: dict, update: bool = False) -> list:
+def clear_account_cache(account: AccountContext = None) -> None:
+    '''
+    清除当前米游社账号的所有账号列表缓存
+    '''
+    uid = login.get_uid(account)
+    if uid is not None:
+        account_cache.delete_prefix(f"{uid}:")
+
+
+def get_account_list(game_id: str, headers: dict, update: bool = False, account: AccountContext = None) -> list:
     '''
     获取账号列表
 
     :param game_id: 游戏ID
     :param headers: 请求头
     :param update: 是否已尝试更新Cookie
+    :param account: 账号上下文，默认为当前账号
 
     :return: 账号列表
     '''
-    http = get_new_session()
+    account = get_account(account)
+    http = account.http
+    log = account.log
     game_name = setting.game_id2name.get(game_id, game_id)
+    cache_key = get_cache_key(game_id, account)
+
+    if not update and cache_key is not None and account_cache_ttl > 0:
+        account_list = account_cache.get(cache_key)
+        if account_list is not None:
+            log.info(f"已从缓存中获取到 {len(account_list)} 个「{game_name}」账号信息")
+            return account_list
 
-    if update and login.update_cookie_token():
-        headers['Cookie'] = config.config['account']['cookie']
+    if update and login.update_cookie_token(account):
+        headers['Cookie'] = account.cookie
     elif update:
         log.warning(f"获取「{game_name}」账号列表失败！")
         raise CookieError("BBS Cookie Error")
@@ -29,7 +68,8 @@ def get_account_list(game_id: str, headers: dict, update: bool = False) -> list:
     response = http.get(setting.account_Info_url, params={"game_biz": game_id}, headers=headers)
     data = response.json()
     if data["retcode"] == -100:
-        return get_account_list(game_id, headers, update=True)
+        clear_account_cache(account)
+        return get_account_list(game_id, headers, update=True, account=account)
 
     if data["retcode"] != 0:
         log.warning(f"获取「{game_name}」账号列表失败！")
@@ -39,5 +79,7 @@ def get_account_list(game_id: str, headers: dict, update: bool = False) -> list:
     for i in data["data"]["list"]:
         account_list.append([i["nickname"], i["game_uid"], i["region"]])
 
+    if cache_key is not None and account_cache_ttl > 0:
+        account_cache.set(cache_key, account_list)
     log.info(f"已获取到 {len(account_list)} 个「{setting.game_id2name.get(game_id, game_id)}」账号信息")
     return account_list
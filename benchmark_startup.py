@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+# 默认测量的入口模块
+default_modules = ["main", "main_multi", "server"]
+
+
+def measure_import(module: str) -> dict:
+    """
+    在新的解释器中使用 -X importtime 导入模块
+
+    :param module: 模块名
+    :return: {"total": 总耗时（微秒）, "modules": {模块名: 累计耗时（微秒）}}
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败：\n{result.stderr}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        # 格式：import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return {"total": modules.get(module, 0), "modules": modules}
+
+
+def run_benchmark(modules: list, repeat: int) -> dict:
+    """
+    多次测量取中位数
+
+    :param modules: 模块名列表
+    :param repeat: 每个模块的测量次数
+    :return: {模块名: {"total": 中位数耗时（微秒）, "top": 耗时最多的依赖}}
+    """
+    results = {}
+    for module in modules:
+        runs = [measure_import(module) for _ in range(repeat)]
+        total = int(statistics.median(i["total"] for i in runs))
+        # 依赖耗时取最后一次的结果，只用于定位问题
+        deps = sorted(runs[-1]["modules"].items(), key=lambda x: x[1], reverse=True)
+        results[module] = {"total": total, "top": [i for i in deps if i[0] != module][:10]}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    与基准结果对比
+
+    :return: 超出阈值的模块列表
+    """
+    regressions = []
+    for module, data in results.items():
+        base = baseline.get(module, {}).get("total")
+        if not base:
+            continue
+        ratio = data["total"] / base
+        print(f"{module}: {base / 1000:.1f} ms -> {data['total'] / 1000:.1f} ms ({ratio - 1:+.1%})")
+        if ratio > 1 + threshold:
+            regressions.append(module)
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量入口模块的导入耗时")
+    parser.add_argument("modules", nargs="*", default=default_modules, help="要测量的模块")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="每个模块的测量次数")
+    parser.add_argument("--baseline", help="基准结果文件，存在时与其对比")
+    parser.add_argument("--save", action="store_true", help="将本次结果保存为基准结果")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的耗时增长比例，超出时返回 1")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.modules, args.repeat)
+    for module, data in results.items():
+        print(f"{module}: {data['total'] / 1000:.1f} ms")
+        for name, cumulative in data["top"]:
+            print(f"  {name}: {cumulative / 1000:.1f} ms")
+
+    if not args.baseline:
+        return 0
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"已保存基准结果到 {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"基准结果文件 {args.baseline} 不存在")
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"导入耗时超出阈值 {args.threshold:.0%}：{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+
+import config
+from loghelper import log
+
+# 缓存文件默认放在配置文件目录下的 cache 文件夹
+cache_path = os.getenv("AutoMihoyoBBS_cache_path", os.path.join(config.path, "cache"))
+
+
+class FileCache:
+    """
+    带过期时间的 JSON 文件缓存，读取后常驻内存，多个账号/线程共用同一个实例
+
+    无法写入文件时（如云函数）只在内存中缓存
+    """
+
+    def __init__(self, name: str, ttl: int):
+        """
+        :param name: 缓存名称，对应 cache 目录下的 {name}.json
+        :param ttl: 默认过期时间（秒）
+        """
+        self.file_path = os.path.join(cache_path, f"{name}.json")
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._data = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = {}
+            if os.path.exists(self.file_path):
+                try:
+                    with open(self.file_path, "r", encoding="utf-8") as f:
+                        self._data = json.load(f)
+                except (OSError, ValueError):
+                    log.warning(f"缓存文件 {self.file_path} 读取失败，已忽略")
+        return self._data
+
+    def _save(self) -> None:
+        if config.serverless:
+            return
+        temp_path = f"{self.file_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(temp_path, self.file_path)
+        except OSError:
+            log.debug(f"缓存文件 {self.file_path} 保存失败")
+
+    def get(self, key: str):
+        """
+        读取缓存，不存在或已过期时返回 None
+        """
+        with self.lock:
+            item = self._load().get(key)
+            if item is None:
+                return None
+            if item["expires"] < time.time():
+                del self._data[key]
+                return None
+            return item["value"]
+
+    def set(self, key: str, value, ttl: int = None, save: bool = True) -> None:
+        """
+        写入缓存
+
+        :param save: 是否立即保存到文件，写入频繁时可以设为 False，之后调用 save 统一保存
+        """
+        with self.lock:
+            self._load()[key] = {"value": value, "expires": time.time() + (self.ttl if ttl is None else ttl)}
+            if save:
+                self._save()
+
+    def save(self) -> None:
+        with self.lock:
+            if self._data is not None:
+                self._save()
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
+
+    def delete_prefix(self, prefix: str) -> None:
+        """
+        删除所有以 prefix 开头的缓存
+        """
+        with self.lock:
+            data = self._load()
+            keys = [key for key in data if key.startswith(prefix)]
+            for key in keys:
+                del data[key]
+            if keys:
+                self._save()
+
+
+class MtimeCache:
+    """
+    按文件修改时间校验的缓存，文件未修改时直接返回上次解析的结果
+    """
+
+    def __init__(self, loader):
+        """
+        :param loader: 解析函数，参数为文件路径
+        """
+        self.loader = loader
+        self.lock = threading.Lock()
+        self._data = {}
+
+    def get(self, file_path: str):
+        """
+        读取文件并解析，文件不存在时抛出 OSError
+        """
+        stat = os.stat(file_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            item = self._data.get(file_path)
+            if item is not None and item[0] == key:
+                return item[1]
+        value = self.loader(file_path)
+        with self.lock:
+            self._data[file_path] = (key, value)
+        return value
@@ -1,69 +1,154 @@
-import random
-import time
-
 import tools
 import config
 import setting
-from request import http
-from loghelper import log
+from context import AccountContext, get_account
+from request import get_shared_async_session
+from result import Status, TaskResult, ResultList
 
 
 class CloudGameBase:
-    def __init__(self, game_name, sign_url, coin_name, clear_cookie_func) -> None:
+    def __init__(self, game_name, sign_url, coin_name, clear_cookie_func, account: AccountContext = None) -> None:
+        """
+        :param clear_cookie_func: token 失效时调用的函数，参数为配置上下文和账号的日志
+        :param account: 账号上下文，默认为当前账号
+        """
+        self.account = get_account(account)
+        self.http = self.account.http
+        self.log = self.account.log
         self.headers = {}
         self.game_name = game_name
         self.sign_url = sign_url
         self.coin_name = coin_name
         self.clear_cookie_func = clear_cookie_func
 
-    def sign_account(self) -> str:
-        log.info(f"{self.game_name}:")
-        ret_msg = f"{self.game_name}:\r\n"
-        
+    @staticmethod
+    def need_recheck(data: dict) -> bool:
+        """
+        判断签到接口没有直接返回获得的时长时，是否需要再次查询确认
+        """
+        free_time_data = data["data"]["free_time"]
+        return int(free_time_data["send_freetime"]) <= 0 and int(free_time_data["free_time"]) < 600
+
+    def get_sign_msg(self, data: dict, data2: dict = None) -> str:
+        """
+        处理签到成功（retcode 为 0）时返回的数据
+
+        :param data: 签到接口返回的数据
+        :param data2: 再次查询时返回的数据
+        :return: 签到结果
+        """
+        ret_msg = ""
+        free_time_data = data["data"]["free_time"]
+        free_time = int(free_time_data["free_time"])
+        send_free_time = int(free_time_data["send_freetime"])
+
+        if send_free_time > 0:
+            self.log.info(f'签到成功，已获得 {send_free_time} 分钟免费时长')
+            ret_msg += f'签到成功，已获得 {send_free_time} 分钟免费时长\n'
+        elif data2 is not None:
+            free_time2 = int(data2["data"]["free_time"]["free_time"])
+            if free_time2 > free_time:
+                get_free_time = free_time2 - free_time
+                self.log.info(f'签到成功，已获得 {get_free_time} 分钟免费时长')
+                ret_msg += f'签到成功，已获得 {get_free_time} 分钟免费时长\n'
+            else:
+                self.log.info('签到失败，未获得免费时长，可能是已经签到过了或者超出免费时长上限')
+                ret_msg += '签到失败，未获得免费时长，可能是已经签到过了或者超出免费时长上限\n'
+        ret_msg += f'你当前拥有免费时长 {tools.time_conversion(int(data["data"]["free_time"]["free_time"]))}，' \
+                   f'畅玩卡状态为 {data["data"]["play_card"]["short_msg"]}，拥有{self.coin_name} {data["data"]["coin"]["coin_num"]} 枚'
+        return ret_msg
+
+    def get_error_msg(self, data: dict, text: str) -> str:
+        """
+        处理签到失败（retcode 不为 0）时返回的数据
+        """
+        if data['retcode'] == -100:
+            ret_msg = f"token 失效/防沉迷"
+            self.clear_cookie_func(self.account.config_ctx, self.log)
+        else:
+            ret_msg = f'脚本签到失败，json 文本：{text}'
+        return ret_msg
+
+    def get_ledger_account(self) -> str:
+        return self.account.ledger.get_token_id(self.headers.get('x-rpc-combo_token', ''))
+
+    def get_done_result(self):
+        """
+        今天已经签到过时直接返回记录的结果，不需要请求接口
+        """
+        done_message = self.account.ledger.get_done(self.game_name, self.get_ledger_account())
+        if done_message is None:
+            return None
+        self.log.info(f"{self.game_name}今天已经签到过")
+        result = TaskResult(self.game_name, f"{self.game_name}:", "\r\n")
+        result.add(None, Status.DONE, done_message)
+        return result
+
+    def save_result(self, result: TaskResult) -> TaskResult:
+        if not result.failed:
+            self.account.ledger.mark_done(self.game_name, self.get_ledger_account(), result.accounts[-1].message)
+        return result
+
+    def sign_account(self) -> TaskResult:
+        done_result = self.get_done_result()
+        if done_result is not None:
+            return done_result
+        self.log.info(f"{self.game_name}:")
+        result = TaskResult(self.game_name, f"{self.game_name}:", "\r\n")
+
         try:
-            req = http.get(url=self.sign_url, headers=self.headers)
+            req = self.http.get(url=self.sign_url, headers=self.headers)
             data = req.json()
 
             if data['retcode'] == 0:
-                free_time_data = data["data"]["free_time"]
-                free_time = int(free_time_data["free_time"])
-                send_free_time = int(free_time_data["send_freetime"])
+                data2 = None
+                if self.need_recheck(data):
+                    self.account.defer(3, 6)
+                    data2 = self.http.get(url=self.sign_url, headers=self.headers).json()
+                result.add(None, Status.SUCCESS, self.get_sign_msg(data, data2))
+                self.log.info(result.render())
+            else:
+                result.add(None, Status.FAILED, self.get_error_msg(data, req.text))
+                self.log.warning(result.render())
+        except Exception as e:
+            self.log.error(f'{self.game_name} 签到异常：{str(e)}')
+            result.add(None, Status.FAILED, '脚本签到发生异常，请查看日志')
+
+        return self.save_result(result)
+
+    async def sign_account_async(self) -> TaskResult:
+        done_result = self.get_done_result()
+        if done_result is not None:
+            return done_result
+        self.log.info(f"{self.game_name}:")
+        result = TaskResult(self.game_name, f"{self.game_name}:", "\r\n")
 
-                if send_free_time > 0:
-                    log.info(f'签到成功，已获得 {send_free_time} 分钟免费时长')
-                    ret_msg += f'签到成功，已获得 {send_free_time} 分钟免费时长\n'
+        try:
+            with self.account.paced():
+                async_http = get_shared_async_session()
+                req = await async_http.get(url=self.sign_url, headers=self.headers)
+                data = req.json()
+
+                if data['retcode'] == 0:
+                    data2 = None
+                    if self.need_recheck(data):
+                        self.account.defer(3, 6)
+                        data2 = (await async_http.get(url=self.sign_url, headers=self.headers)).json()
+                    result.add(None, Status.SUCCESS, self.get_sign_msg(data, data2))
+                    self.log.info(result.render())
                 else:
-                    if free_time < 600:
-                        time.sleep(random.randint(3, 6))
-                        data2 = http.get(url=self.sign_url, headers=self.headers).json()
-                        free_time2 = int(data2["data"]["free_time"]["free_time"])
-                        if free_time2 > free_time:
-                            get_free_time = free_time2 - free_time
-                            log.info(f'签到成功，已获得 {get_free_time} 分钟免费时长')
-                            ret_msg += f'签到成功，已获得 {get_free_time} 分钟免费时长\n'
-                        else:
-                            log.info('签到失败，未获得免费时长，可能是已经签到过了或者超出免费时长上限')
-                            ret_msg += '签到失败，未获得免费时长，可能是已经签到过了或者超出免费时长上限\n'
-                ret_msg += f'你当前拥有免费时长 {tools.time_conversion(int(data["data"]["free_time"]["free_time"]))}，' \
-                           f'畅玩卡状态为 {data["data"]["play_card"]["short_msg"]}，拥有{self.coin_name} {data["data"]["coin"]["coin_num"]} 枚'
-                log.info(ret_msg)
-            elif data['retcode'] == -100:
-                ret_msg += f"token 失效/防沉迷"
-                log.warning(ret_msg)
-                self.clear_cookie_func()
-            else:
-                ret_msg += f'脚本签到失败，json 文本：{req.text}'
-                log.warning(ret_msg)
+                    result.add(None, Status.FAILED, self.get_error_msg(data, req.text))
+                    self.log.warning(result.render())
         except Exception as e:
-            log.error(f'{self.game_name} 签到异常：{str(e)}')
-            ret_msg += '脚本签到发生异常，请查看日志'
-        
-        return ret_msg
+            self.log.error(f'{self.game_name} 签到异常：{str(e)}')
+            result.add(None, Status.FAILED, '脚本签到发生异常，请查看日志')
+
+        return self.save_result(result)
 
 
 class CloudGenshin(CloudGameBase):
-    def __init__(self, token) -> None:
-        super().__init__("云原神", setting.cloud_genshin_sgin, "米云币", config.clear_cookie_cloudgame_genshin)
+    def __init__(self, token, account: AccountContext = None) -> None:
+        super().__init__("云原神", setting.cloud_genshin_sgin, "米云币", config.clear_cookie_cloudgame_genshin, account)
         self.headers = {
             'Host': 'api-cloudgame.mihoyo.com',
             'Accept': '*/*',
@@ -76,8 +161,8 @@ class CloudGenshin(CloudGameBase):
 
 
 class CloudZZZ(CloudGameBase):
-    def __init__(self, token) -> None:
-        super().__init__("云绝区零", setting.cloud_zzz_sgin, "邦邦点", config.clear_cookie_cloudgame_zzz)
+    def __init__(self, token, account: AccountContext = None) -> None:
+        super().__init__("云绝区零", setting.cloud_zzz_sgin, "邦邦点", config.clear_cookie_cloudgame_zzz, account)
         self.headers = {
             'Host': 'cg-nap-api.mihoyo.com',
             'Accept': '*/*',
@@ -88,20 +173,33 @@ class CloudZZZ(CloudGameBase):
         }
 
 
-def run_task() -> str:
-    ret_msg = ""
-    cg_cn = config.config['cloud_games']['cn']
+def get_cloud_games(account: AccountContext = None) -> list:
+    """
+    获取需要签到的云游戏列表
+    """
+    account = get_account(account)
+    cloud_games = []
+    cg_cn = account.config['cloud_games']['cn']
     if not cg_cn['enable']:
-        return ""
+        return cloud_games
     # 云原神签到
     if cg_cn['genshin']['enable'] and cg_cn['genshin']['token'] != "":
-        cg_genshin = CloudGenshin(cg_cn['genshin']['token'])
-        ret_msg += cg_genshin.sign_account() + "\n\n"
+        cloud_games.append(CloudGenshin(cg_cn['genshin']['token'], account))
     # 云绝区零签到
     if cg_cn['zzz']['enable'] and cg_cn['zzz']['token'] != "":
-        cg_zzz = CloudZZZ(cg_cn['zzz']['token'])
-        ret_msg += cg_zzz.sign_account() + "\n\n"
-    return ret_msg
+        cloud_games.append(CloudZZZ(cg_cn['zzz']['token'], account))
+    return cloud_games
+
+
+def run_task(account: AccountContext = None) -> ResultList:
+    return ResultList((cloud_game.sign_account() for cloud_game in get_cloud_games(account)), suffix="\n\n")
+
+
+async def run_task_async(account: AccountContext = None) -> ResultList:
+    results = ResultList(suffix="\n\n")
+    for cloud_game in get_cloud_games(account):
+        results.append(await cloud_game.sign_account_async())
+    return results
 
 
 if __name__ == '__main__':
@@ -1,16 +1,30 @@
 import collections
 import os
+import errno
+import shutil
+import atexit
+import sqlite3
+import threading
+import sys
+import types
 import yaml
+import contextlib
+import contextvars
 from copy import deepcopy
 
 from loghelper import log
+from error import ConfigError
+
+# 安装了 libyaml 时使用 C 实现的解析/输出，速度快很多，否则回退到纯 Python 实现
+yaml_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+yaml_dumper = getattr(yaml, "CDumper", yaml.Dumper)
 
 # 这个字段现在还没找好塞什么地方好，就先塞config这里了
 serverless = False
 # 提示需要更新config版本
 update_config_need = False
 
-config = {
+_default_config = {
     'enable': True, 'version': 15, "push": "",
     'account': {'cookie': '', 'stuid': '', 'stoken': '', 'mid': ''},
     'device': {'name': 'Xiaomi MI 6', 'model': 'Mi 6', 'id': '', 'fp': ''},
@@ -57,7 +71,7 @@ config = {
     },
     'web_activity': {'enable': False, 'activities': []}
 }
-config_raw = deepcopy(config)
+config_raw = deepcopy(_default_config)
 
 path = os.path.dirname(os.path.realpath(__file__)) + "/config"
 if os.getenv("AutoMihoyoBBS_config_path") is not None:
@@ -65,16 +79,103 @@ if os.getenv("AutoMihoyoBBS_config_path") is not None:
 config_prefix = os.getenv("AutoMihoyoBBS_config_prefix")
 if config_prefix is None:
     config_prefix = ""
-config_Path = f"{path}/{config_prefix}config.yaml"
+
+
+class ConfigContext:
+    """
+    单个账号的配置上下文
+
+    多账号并发执行时每个账号持有一份独立的上下文，避免互相覆盖 config.config 和 config.config_Path
+    """
+
+    def __init__(self, config_path: str = None, data: dict = None, store=None):
+        """
+        :param config_path: 配置文件路径，使用账号库时为账号名
+        :param data: 初始配置
+        :param store: 账号库（fleet.FleetStore），为 None 时从配置文件读写
+        """
+        self.config_path = config_path if config_path else f"{path}/{config_prefix}config.yaml"
+        self.config = data if data is not None else deepcopy(config_raw)
+        self.store = store
+        # 等待写入的配置 {路径: 配置}，由 flush_config 统一写入
+        self.pending = {}
+        # 最后一次读取/写入文件时的配置内容，用于判断是否需要写入
+        self.snapshots = {}
+
+
+# 未绑定任何上下文时使用的全局上下文，单用户模式和原有的顺序执行都走这里
+_global_context = ConfigContext(data=deepcopy(_default_config))
+_current_context = contextvars.ContextVar("AutoMihoyoBBS_config_context", default=None)
+
+
+def get_context() -> ConfigContext:
+    """
+    获取当前线程/协程绑定的配置上下文，没有绑定时返回全局上下文
+    """
+    ctx = _current_context.get()
+    return ctx if ctx is not None else _global_context
+
+
+@contextlib.contextmanager
+def use_context(ctx: ConfigContext):
+    """
+    在 with 块内把配置上下文绑定到当前线程/协程
+
+    :param ctx: 要绑定的配置上下文
+    """
+    token = _current_context.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current_context.reset(token)
+        flush_config(ctx)
+
+
+class _ConfigModule(types.ModuleType):
+    """
+    让 config.config / config.config_Path 指向当前上下文，兼容原有的模块属性读写方式
+    """
+
+    @property
+    def config(self) -> dict:
+        return get_context().config
+
+    @config.setter
+    def config(self, value: dict):
+        get_context().config = value
+
+    @property
+    def config_Path(self) -> str:
+        return get_context().config_path
+
+    @config_Path.setter
+    def config_Path(self, value: str):
+        get_context().config_path = value
+
+
+sys.modules[__name__].__class__ = _ConfigModule
 
 
 def copy_config():
     return deepcopy(config_raw)
 
 
+# 配置迁移 {旧版本号: 迁移函数}，迁移函数直接修改传入的配置（已是副本）并返回，版本号需要更新到迁移后的版本
+config_migrations = {}
+
+
+def migration(version: int):
+    """
+    注册从 version 版本开始的配置迁移
+    """
+    def decorator(func):
+        config_migrations[version] = func
+        return func
+    return decorator
+
+
+@migration(11)
 def config_v11_update(data: dict):
-    global update_config_need
-    update_config_need = True
     data['version'] = 13
     new_config = {}
     for key in data:
@@ -83,154 +184,387 @@ def config_v11_update(data: dict):
         if key == "cloud_games":
             new_config['cloud_games'] = deepcopy(config_raw['cloud_games'])
             continue
-        new_config[key] = deepcopy(data[key])
+        new_config[key] = data[key]
     new_config['cloud_games']['cn']['enable'] = data['cloud_games']['genshin']['enable']
     new_config['cloud_games']['cn']['genshin']['enable'] = data['cloud_games']['genshin']['enable']
     new_config['cloud_games']['cn']['genshin']['token'] = data['cloud_games']['genshin']['token']
-    log.info("config 已升级到：13")
     return new_config
 
 
+@migration(12)
 def config_v12_update(data: dict):
-    global update_config_need
-    update_config_need = True
     data['version'] = 13
     data['cloud_games']['cn']['zzz'] = {'enable': False, 'token': ""}
-    log.info("config 已升级到: 13")
     return data
 
 
+@migration(13)
 def config_v13_update(data: dict):
-    global update_config_need
-    update_config_need = True
-    new_config = deepcopy(data)
+    data['version'] = 14
+    data['device'].setdefault('fp', '')
+    return data
 
-    # 确保版本号更新为14
-    new_config['version'] = 14
-    new_config['device']['fp'] = config['device'].get('fp', '')
 
-    log.info("config 已升级到：14")
-    return new_config
+@migration(14)
+def update_v14_update(data: dict):
+    data['version'] = 15
+    data['web_activity'] = {'enable': False, 'activities': []}
+    return data
 
 
-def update_v14_update(data: dict):
-    global update_config_need
-    update_config_need = True
-    new_config = deepcopy(data)
-    new_config['version'] = 15
-    new_config['web_activity'] = {'enable': False, 'activities': []}
-    log.info("config 已升级到：15")
-    return new_config
+def migrate_config(data: dict) -> tuple:
+    """
+    按注册的迁移依次升级到当前版本
+
+    :param data: 配置，会被直接修改
+    :return: (升级后的配置, 是否进行了升级)
+    """
+    migrated = False
+    while data.get('version') != config_raw['version'] and data.get('version') in config_migrations:
+        data = config_migrations[data['version']](data)
+        migrated = True
+        log.info(f"config 已升级到：{data['version']}")
+    return data, migrated
+
+
+def fill_config_defaults(data: dict, schema: dict = None, key_path: str = "") -> list:
+    """
+    使用默认配置补全缺少的配置项，旧版本的配置中没有新增的游戏等配置项时不需要报错
+
+    :param data: 配置，会被直接修改
+    :param schema: 对应位置的默认配置
+    :param key_path: 当前位置
+    :return: 补全的配置项列表
+    """
+    if schema is None:
+        schema = _default_config
+    filled = []
+    for key, default in schema.items():
+        child_path = f"{key_path}.{key}" if key_path else key
+        if key not in data:
+            data[key] = deepcopy(default)
+            filled.append(child_path)
+        elif data[key] is None and isinstance(default, (list, dict)):
+            # YAML 中留空的配置项（如 black_list:）读取为 None，按默认值处理
+            data[key] = deepcopy(default)
+            filled.append(child_path)
+        elif isinstance(default, dict) and isinstance(data[key], dict):
+            filled.extend(fill_config_defaults(data[key], default, child_path))
+    return filled
+
+
+# 默认值为字符串的配置项，YAML 中没有加引号的数字和空值也可以使用
+_str_types = (str, int, float, type(None))
+
+
+def validate_config(data, schema=None, key_path: str = "") -> list:
+    """
+    按默认配置的结构检查配置，缺少配置项、类型错误时返回错误信息，多出的配置项不检查
+
+    缺少的配置项由 fill_config_defaults 补全，这里主要检查类型
+
+    :param data: 配置
+    :param schema: 对应位置的默认配置
+    :param key_path: 当前位置，用于错误信息
+    :return: 错误信息列表
+    """
+    if schema is None:
+        schema = _default_config
+    if not isinstance(data, dict):
+        return [f"{key_path or '配置'} 应为字典"]
+    errors = []
+    for key, default in schema.items():
+        child_path = f"{key_path}.{key}" if key_path else key
+        if key not in data:
+            errors.append(f"缺少配置项 {child_path}")
+            continue
+        value = data[key]
+        if isinstance(default, dict):
+            errors.extend(validate_config(value, default, child_path))
+        elif isinstance(default, bool):
+            if not isinstance(value, bool):
+                errors.append(f"{child_path} 应为 true/false")
+        elif isinstance(default, int):
+            if isinstance(value, bool) or not isinstance(value, int):
+                errors.append(f"{child_path} 应为整数")
+        elif isinstance(default, list):
+            if not isinstance(value, list):
+                errors.append(f"{child_path} 应为列表")
+        elif not isinstance(value, _str_types):
+            errors.append(f"{child_path} 应为字符串")
+    return errors
+
+
+def prepare_config(raw: dict, p_path: str) -> tuple:
+    """
+    迁移并检查配置，在发出任何请求之前发现配置错误
+
+    :param raw: 读取到的配置，不会被修改
+    :param p_path: 配置文件路径，用于错误信息
+    :return: (原始配置, 迁移后的配置, 是否进行了迁移)
+    """
+    if not isinstance(raw, dict) or not isinstance(raw.get('version'), int):
+        raise ConfigError(f"{p_path} 配置格式错误，缺少版本号")
+    if raw['version'] != config_raw['version'] and raw['version'] not in config_migrations:
+        raise ConfigError(f"{p_path} 配置版本 {raw['version']} 不受支持")
+    # 结果会被缓存，每个文件只在修改后复制一次
+    data = deepcopy(raw)
+    migrated = False
+    if raw['version'] != config_raw['version']:
+        try:
+            data, migrated = migrate_config(data)
+        except (KeyError, TypeError) as e:
+            raise ConfigError(f"{p_path} 配置升级失败，缺少配置项 {e}")
+    filled = fill_config_defaults(data)
+    if filled:
+        log.debug(f"{p_path} 缺少的配置项已使用默认值：{', '.join(filled)}")
+    errors = validate_config(data)
+    if errors:
+        raise ConfigError(f"{p_path} 配置错误：" + "；".join(errors))
+    # 去除cookie最末尾的空格
+    data["account"]["cookie"] = str(data["account"]["cookie"]).rstrip(' ')
+    return raw, data, migrated
+
+
+def parse_config_file(p_path: str) -> dict:
+    with open(p_path, "r", encoding='utf-8') as f:
+        return yaml.load(f, Loader=yaml_loader)
+
+
+def load_config_file(p_path: str) -> tuple:
+    return prepare_config(parse_config_file(p_path), p_path)
+
+
+def get_file_cache():
+    """
+    按路径和修改时间缓存迁移、检查后的配置文件，server 模式下重新加载时只处理修改过的文件
+
+    cache 模块依赖本模块，所以在第一次使用时才创建
+    """
+    global _file_cache
+    if _file_cache is None:
+        from cache import MtimeCache
+        _file_cache = MtimeCache(load_config_file)
+    return _file_cache
+
+
+_file_cache = None
 
 
 def load_config(p_path=None):
-    global config
+    global update_config_need
+    ctx = get_context()
     if not p_path:
-        p_path = config_Path
-    with open(p_path, "r", encoding='utf-8') as f:
-        data = yaml.load(f, Loader=yaml.FullLoader)
-    if data['version'] != config_raw['version']:
-        if data['version'] == 11:
-            data = config_v11_update(data)
-        if data['version'] == 12:
-            data = config_v12_update(data)
-        if data['version'] == 13:
-            data = config_v13_update(data)
-        if data['version'] == 14:
-            data = update_v14_update(data)
-        save_config(p_config=data)
-    # 去除cookie最末尾的空格
-    data["account"]["cookie"] = str(data["account"]["cookie"]).rstrip(' ')
-    config = data
+        p_path = ctx.config_path
+    # 之前没有写入的修改基于旧的配置，重新读取后丢弃，避免之后覆盖文件中新的内容
+    with _pending_lock:
+        ctx.pending.pop(p_path, None)
+    # 缓存中的数据不会被修改，原始配置直接作为快照，返回副本供之后修改
+    if ctx.store is not None and p_path == ctx.config_path:
+        try:
+            stored = ctx.store.get(p_path)
+        except KeyError:
+            # 账号不存在只影响这个账号，与配置文件错误一样处理
+            raise ConfigError(f"账号库中不存在账号 {p_path}") from None
+        raw, data, migrated = prepare_config(stored, p_path)
+    else:
+        raw, data, migrated = get_file_cache().get(p_path)
+    ctx.snapshots[p_path] = raw
+    data = deepcopy(data)
+    if migrated:
+        # 迁移结果随配置一起缓存，无法保存升级后的配置时每次加载都会提示手动更新
+        update_config_need = True
+        save_config(p_path, data)
+    ctx.config = data
     log.info("Config 加载完毕")
     return data
 
 
-def save_config(p_path=None, p_config=None):
-    global serverless
+def save_config(p_path=None, p_config=None, flush: bool = False, ctx: ConfigContext = None):
+    """
+    保存配置，默认只记录需要保存，同一次运行中的多次修改由 flush_config 合并为一次写入
+
+    :param p_path: 配置文件路径，默认为当前上下文的配置文件
+    :param p_config: 配置内容，默认为当前上下文的配置
+    :param flush: 是否立即写入
+    :param ctx: 配置上下文，默认为当前上下文
+    """
     if serverless:
         log.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
     if not p_path:
-        p_path = config_Path
+        p_path = ctx.config_path
     if not p_config:
-        p_config = config
-    with open(p_path, "w+") as f:
-        try:
-            f.seek(0)
-            f.truncate()
-            f.write(yaml.dump(p_config, Dumper=yaml.Dumper, sort_keys=False))
+        p_config = ctx.config
+    with _pending_lock:
+        ctx.pending[p_path] = p_config
+        _pending_contexts.add(ctx)
+    if flush:
+        flush_config(ctx)
+
+
+def write_file_atomic(file_path: str, content: str) -> None:
+    """
+    先写入同目录下的临时文件并 fsync，再替换原文件，写入过程中出错不会损坏原文件
+
+    临时文件沿用原文件的权限，保存 Cookie 的配置文件不会因为替换变成其他用户可读；
+    原文件是单独挂载的文件（Docker 单文件挂载）等无法替换的情况下改为直接写入原文件
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(content)
             f.flush()
-        except OSError:
-            serverless = True
-            log.info("Cookie 保存失败")
+            os.fsync(f.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except OSError as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+        log.debug(f"{file_path} 无法替换，直接写入原文件")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def flush_config(ctx: ConfigContext = None) -> None:
+    """
+    写入等待保存的配置，内容与文件中的一致时不写入
+
+    :param ctx: 配置上下文，默认为当前上下文
+    """
+    if ctx is None:
+        ctx = get_context()
+    with _pending_lock:
+        pending, ctx.pending = ctx.pending, {}
+        _pending_contexts.discard(ctx)
+    for p_path, p_config in pending.items():
+        if serverless:
+            log.info("云函数执行，无法保存")
+            return
+        if ctx.snapshots.get(p_path) == p_config:
+            log.debug("Config 没有变化，无需保存")
+            continue
+        use_store = ctx.store is not None and p_path == ctx.config_path
+        if not use_store and p_path in ctx.snapshots and not os.path.exists(p_path):
+            # 读取过的配置文件已经被删除（如临时配置文件），不再重新创建
+            log.debug(f"{p_path} 已被删除，无需保存")
+            ctx.snapshots.pop(p_path, None)
+            continue
+        try:
+            if use_store:
+                ctx.store.put(p_path, p_config)
+            else:
+                write_file_atomic(p_path, yaml.dump(p_config, Dumper=yaml_dumper, sort_keys=False))
+        except (OSError, sqlite3.Error) as e:
+            # 只是这个配置保存失败，不影响其他账号保存
+            log.warning(f"Cookie 保存失败：{e}")
         else:
+            ctx.snapshots[p_path] = deepcopy(p_config)
             log.info("Config 保存完毕")
 
 
-def clear_stoken():
-    global config
+def flush_all_config() -> None:
+    with _pending_lock:
+        contexts = list(_pending_contexts)
+    for ctx in contexts:
+        flush_config(ctx)
+
+
+# 有等待保存的配置的上下文，退出时统一写入
+_pending_contexts = set()
+_pending_lock = threading.Lock()
+atexit.register(flush_all_config)
+
+
+def clear_stoken(ctx: ConfigContext = None, logger=None):
+    # 传入账号的日志时日志前带有账号名，多个账号同时执行时可以区分
+    logger = logger or log
     if serverless:
-        log.info("云函数执行，无法保存")
+        logger.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
+    config = ctx.config
     config["account"]["mid"] = ""
     config["account"]["stuid"] = ""
     config["account"]["stoken"] = "StokenError"
-    log.info("Stoken 已删除")
-    save_config()
+    logger.info("Stoken 已删除")
+    save_config(ctx=ctx)
 
 
-def clear_cookie():
-    global config
+def clear_cookie(ctx: ConfigContext = None, logger=None):
+    logger = logger or log
     if serverless:
-        log.info("云函数执行，无法保存")
+        logger.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
+    config = ctx.config
     config["account"]["cookie"] = "CookieError"
-    log.info(f"Cookie 已删除")
-    save_config()
+    logger.info(f"Cookie 已删除")
+    save_config(ctx=ctx)
 
 
-def disable_games(region: str = "cn"):
-    global config
+def disable_games(region: str = "cn", ctx: ConfigContext = None, logger=None):
+    logger = logger or log
     if serverless:
-        log.info("云函数执行，无法保存")
+        logger.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
+    config = ctx.config
     config['games'][region]['enable'] = False
-    log.info(f"游戏签到（{region}）已关闭")
-    save_config()
+    logger.info(f"游戏签到（{region}）已关闭")
+    save_config(ctx=ctx)
 
 
-def clear_cookie_cloudgame_genshin():
-    global config
+def clear_cookie_cloudgame_genshin(ctx: ConfigContext = None, logger=None):
+    logger = logger or log
     if serverless:
-        log.info("云函数执行，无法保存")
+        logger.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
+    config = ctx.config
     config['cloud_games']['cn']['genshin']["enable"] = False
     config['cloud_games']['cn']['genshin']['token'] = ""
-    log.info("国服云原神 Cookie 删除完毕")
-    save_config()
+    logger.info("国服云原神 Cookie 删除完毕")
+    save_config(ctx=ctx)
 
 
-def clear_cookie_cloudgame_genshin_os():
-    global config
+def clear_cookie_cloudgame_genshin_os(ctx: ConfigContext = None, logger=None):
+    logger = logger or log
     if serverless:
-        log.info("云函数执行，无法保存")
+        logger.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
+    config = ctx.config
     config['cloud_games']['os']['genshin']["enable"] = False
     config['cloud_games']['os']['genshin']['token'] = ""
-    log.info("国际服云原神 Cookie 删除完毕")
-    save_config()
+    logger.info("国际服云原神 Cookie 删除完毕")
+    save_config(ctx=ctx)
 
 
-def clear_cookie_cloudgame_zzz():
-    global config
+def clear_cookie_cloudgame_zzz(ctx: ConfigContext = None, logger=None):
+    logger = logger or log
     if serverless:
-        log.info("云函数执行，无法保存")
+        logger.info("云函数执行，无法保存")
         return None
+    if ctx is None:
+        ctx = get_context()
+    config = ctx.config
     config['cloud_games']['cn']['zzz']["enable"] = False
     config['cloud_games']['cn']['zzz']['token'] = ""
-    log.info("国服云绝区零 Cookie 删除完毕")
-    save_config()
+    logger.info("国服云绝区零 Cookie 删除完毕")
+    save_config(ctx=ctx)
 
 
 if __name__ == "__main__":
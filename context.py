@@ -0,0 +1,141 @@
+import copy
+import contextlib
+from contextvars import ContextVar
+
+import config
+import ledger
+import pacing
+from loghelper import log
+from request import get_shared_session
+
+
+class AccountLogger:
+    """
+    在日志前加上账号名，多个账号同时执行时可以区分日志属于哪个账号
+    """
+
+    def __init__(self, logger, name: str):
+        self.logger = logger
+        self.prefix = f"【{name}】"
+
+    def debug(self, msg, *args, **kwargs):
+        self.logger.debug(self.prefix + str(msg), *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.logger.info(self.prefix + str(msg), *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.logger.warning(self.prefix + str(msg), *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.logger.error(self.prefix + str(msg), *args, **kwargs)
+
+    def exception(self, msg, *args, **kwargs):
+        self.logger.exception(self.prefix + str(msg), *args, **kwargs)
+
+
+class AccountContext:
+    """
+    单个米游社账号执行任务时使用的状态：配置、设备信息、http 客户端、每日记录和日志
+
+    米游社任务、游戏签到、云游戏签到和登录相关的函数通过参数显式接收，
+    config.config 和 pacing 的上下文只作为兼容没有传入账号的代码的入口，由 bind 绑定
+    """
+
+    def __init__(self, config_ctx: config.ConfigContext = None, name: str = None, http=None,
+                 pacer: pacing.Pacer = None):
+        """
+        :param config_ctx: 配置上下文，默认为当前上下文
+        :param name: 账号名称，设置后日志前会加上账号名
+        :param http: http 客户端，默认为进程内共享的客户端
+        :param pacer: 请求节奏，默认为当前上下文的 Pacer
+        """
+        self.config_ctx = config_ctx if config_ctx is not None else config.get_context()
+        self.name = name
+        self._http = http
+        self.pacer = pacer if pacer is not None else pacing.get_pacer()
+        self.ledger = ledger
+        self.log = AccountLogger(log, name) if name else log
+
+    @property
+    def http(self):
+        # 第一次发出请求时才获取共享客户端，所有任务都未启用时不需要创建
+        if self._http is None:
+            self._http = get_shared_session()
+        # 请求按该账号的 Pacer 等待，账号没有绑定到当前上下文时 defer 也会生效
+        return pacing.PacedSession(self._http, self.pacer)
+
+    @property
+    def config(self) -> dict:
+        return self.config_ctx.config
+
+    @property
+    def device(self) -> dict:
+        return self.config["device"]
+
+    @property
+    def cookie(self) -> str:
+        return self.config["account"]["cookie"]
+
+    def save_config(self) -> None:
+        config.save_config(self.config_ctx.config_path, self.config, ctx=self.config_ctx)
+
+    def clear_cookie(self) -> None:
+        config.clear_cookie(self.config_ctx, self.log)
+
+    def clear_stoken(self) -> None:
+        config.clear_stoken(self.config_ctx, self.log)
+
+    def disable_games(self, region: str = "cn") -> None:
+        config.disable_games(region, self.config_ctx, self.log)
+
+    def defer(self, min_seconds: float, max_seconds: float) -> None:
+        """
+        该账号的下一个请求至少在随机秒数之后发出，见 pacing.Pacer.defer
+
+        通过 http 发出的请求和 paced 块内的异步请求会等待
+        """
+        self.pacer.defer(min_seconds, max_seconds)
+
+    def paced(self):
+        """
+        在 with 块内请求节奏的钩子使用该账号的 Pacer，用于在函数内新建的异步客户端
+        """
+        return pacing.use_pacer(self.pacer)
+
+    def with_pacer(self, pacer: pacing.Pacer):
+        """
+        返回使用另一个 Pacer 的副本，其他状态共用，用于同一个账号内同时执行的任务
+        """
+        account = copy.copy(self)
+        account.pacer = pacer
+        return account
+
+    @contextlib.contextmanager
+    def bind(self):
+        """
+        在 with 块内把该账号绑定到当前线程/协程，没有传入账号的代码、请求节奏的钩子使用同一个账号的状态
+        """
+        token = _current_account.set(self)
+        try:
+            with config.use_context(self.config_ctx), pacing.use_pacer(self.pacer):
+                yield self
+        finally:
+            _current_account.reset(token)
+
+
+_current_account = ContextVar("current_account", default=None)
+
+
+def get_account(account: AccountContext = None) -> AccountContext:
+    """
+    获取账号上下文，传入时直接返回，否则返回当前绑定的账号，没有绑定时按当前的配置上下文创建
+
+    :param account: 显式传入的账号上下文
+    """
+    if account is not None:
+        return account
+    account = _current_account.get()
+    if account is not None and account.config_ctx is config.get_context():
+        return account
+    return AccountContext()
@@ -455,6 +455,8 @@ class DaCapoAdapter:
 
             log.info("执行米游社签到任务...")
             status_code, message = main.main()
+            # 执行结果为 ResultList，渲染一次，推送和日志共用
+            message = str(message)
 
             if temp_push_path:
                 log.info("推送执行结果...")
@@ -7,13 +7,48 @@ from loghelper import log
 from crontab import CronTab
 
 time_format = "%Y-%m-%d %H:%M:%S"
+# 收到 SIGINT 后设置，用于区分签到代码中的 exit 和停止容器
+stopping = False
 
 
 def stop_me(_signo, _stack):
+    global stopping
+    stopping = True
     log.info("Docker container has stoped....")
     exit(-1)
 
 
+def sign_in_process(multi: bool):
+    """
+    在当前进程内执行签到，模块只导入一次，连接池和解析好的配置可以在多次执行之间复用
+
+    执行过程中的任何异常（包括签到代码中的 exit）都只记录日志，不会导致容器的主循环退出，
+    收到 SIGINT 时的退出会继续向上抛出
+    """
+    try:
+        import push
+        import config
+
+        # 每次执行前重置，避免上一次的配置升级提示一直带到后续的推送里
+        config.update_config_need = False
+        if multi:
+            import main_multi
+
+            status, push_message = main_multi.main_multi(True)
+            push.PushHandler().push(status, push_message)
+            push.retry_outbox()
+        else:
+            import main
+
+            main.task_run()
+    except SystemExit as e:
+        if stopping:
+            raise
+        log.exception(f"签到执行失败：{e!r}")
+    except Exception as e:
+        log.exception(f"签到执行失败：{e!r}")
+
+
 def main():
     signal.signal(signal.SIGINT, stop_me)
     log.info("使用 DOCKER 运行米游社签到")
@@ -32,7 +67,9 @@ def main():
     def sign():
         log.info("Starting signing")
         multi = env["MULTI"].upper()
-        if multi == 'TRUE':
+        if env.get("IN_PROCESS", "FALSE").upper() == 'TRUE':
+            sign_in_process(multi == 'TRUE')
+        elif multi == 'TRUE':
             os.system("python3 ./main_multi.py autorun")
         else:
             os.system("python3 ./main.py")
@@ -20,3 +20,11 @@ class CaptchaError(Exception):
 
     def __str__(self):
         return repr(self.info)
+
+
+class ConfigError(Exception):
+    def __init__(self, info):
+        self.info = info
+
+    def __str__(self):
+        return repr(self.info)
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+from contextlib import closing
+
+import config
+from loghelper import log
+
+# 账号库文件，设置环境变量 AutoMihoyoBBS_fleet_path 或者该文件存在时多用户模式从账号库读取账号
+fleet_path = os.getenv("AutoMihoyoBBS_fleet_path", os.path.join(config.path, "fleet.db"))
+fleet_enable = os.getenv("AutoMihoyoBBS_fleet_path") is not None or os.path.exists(fleet_path)
+
+
+class FleetStore:
+    """
+    账号库，所有账号的配置保存在一个 SQLite 文件中，以账号名为主键
+
+    每个账号单独读取和写入，修改一个账号时不需要重写其他账号，多个线程/进程可以同时读写
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def _connect(self):
+        dir_name = os.path.dirname(self.file_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        conn = sqlite3.connect(self.file_path, timeout=30, isolation_level=None)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS accounts ("
+            "name TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        return conn
+
+    def list_names(self, prefix: str = "") -> list:
+        """
+        获取所有账号名
+
+        :param prefix: 只返回以此开头的账号名
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT name FROM accounts WHERE substr(name, 1, ?) = ? ORDER BY name", (len(prefix), prefix)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, name: str) -> dict:
+        """
+        读取账号配置，账号不存在时抛出 KeyError
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT data FROM accounts WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"账号库中不存在账号 {name}")
+        return json.loads(row[0])
+
+    def put(self, name: str, data: dict) -> None:
+        """
+        写入账号配置，账号不存在时新建
+        """
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO accounts (name, data, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+                (name, json.dumps(data, ensure_ascii=False), time.time()),
+            )
+
+    def delete(self, name: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM accounts WHERE name = ?", (name,))
+
+    def import_files(self, file_names: list) -> int:
+        """
+        把 config 目录下的配置文件导入账号库，账号名为文件名，已存在的账号会被覆盖
+
+        :param file_names: 配置文件名列表
+        :return: 导入的账号数量
+        """
+        for file_name in file_names:
+            self.put(file_name, config.parse_config_file(os.path.join(config.path, file_name)))
+            log.info(f"已导入 {file_name}")
+        return len(file_names)
+
+    def export_files(self, dir_path: str) -> int:
+        """
+        把账号库中的账号导出为配置文件，文件名为账号名
+
+        :param dir_path: 导出的目录
+        :return: 导出的账号数量
+        """
+        os.makedirs(dir_path, exist_ok=True)
+        names = self.list_names()
+        for name in names:
+            content = config.yaml.dump(self.get(name), Dumper=config.yaml_dumper, sort_keys=False)
+            config.write_file_atomic(os.path.join(dir_path, name), content)
+            log.info(f"已导出 {name}")
+        return len(names)
+
+
+fleet_store = FleetStore(fleet_path)
+
+
+def main() -> int:
+    """
+    账号库管理
+
+    python fleet.py import [文件名...]  导入 config 目录下的配置文件，不指定文件名时导入所有配置文件
+    python fleet.py export <目录>       导出为配置文件
+    python fleet.py list                列出所有账号
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "export", "list"):
+        print(main.__doc__)
+        return 1
+    command = sys.argv[1]
+    if command == "import":
+        import main_multi
+
+        file_names = sys.argv[2:] or main_multi.find_config(".yaml") + main_multi.find_config(".yml")
+        log.info(f"已导入 {fleet_store.import_files(file_names)} 个账号到 {fleet_path}")
+    elif command == "export":
+        if len(sys.argv) < 3:
+            print(main.__doc__)
+            return 1
+        log.info(f"已导出 {fleet_store.export_files(sys.argv[2])} 个账号到 {sys.argv[2]}")
+    else:
+        for name in fleet_store.list_names():
+            print(name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,52 @@
+import os
 import time
 import login
 import tools
-import config
-import random
+import pacing
 import captcha
 import setting
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from cache import FileCache
+from result import Status, TaskResult, ResultList
 from error import *
-from request import get_new_session
-from loghelper import log
-from account import get_account_list
+from context import AccountContext, get_account
+from ratelimit import rate_limiter, backoff_base, backoff_max
+from account import get_account_list, clear_account_cache
+
+# 签到奖励列表所有账号都一样，每个月才会更新，按 活动ID:月份 缓存
+rewards_cache = FileCache("checkin_rewards", 31 * 86400)
+_rewards_locks = {}
+_rewards_locks_lock = threading.Lock()
+
+
+def get_rewards_cache_key() -> tuple:
+    """
+    获取当前月份以及到下个月的剩余秒数，签到奖励按北京时间每月更新
+
+    :return: (月份, 剩余秒数)
+    """
+    now = datetime.now(timezone(timedelta(hours=8)))
+    next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return now.strftime("%Y-%m"), int((next_month - now).total_seconds())
+
+
+def get_retry_after(response) -> float:
+    """
+    获取 429 响应要求的等待时间，没有 Retry-After 时使用限速器的默认退避时间
+    """
+    try:
+        return min(max(float(response.headers.get("Retry-After", backoff_base)), 0), backoff_max)
+    except ValueError:
+        return backoff_base
 
 
 class GameCheckin:
 
-    def __init__(self, game_id: str, game_mid: str, game_name: str, act_id: str, player_name: str = "玩家") -> None:
+    def __init__(self, game_id: str, game_mid: str, game_name: str, act_id: str, player_name: str = "玩家",
+                 account: AccountContext = None) -> None:
         """
         游戏签到
 
@@ -22,14 +55,17 @@ class GameCheckin:
         :param game_name: 游戏名称
         :param act_id: 签到活动ID
         :param player_name: 玩家称呼
+        :param account: 账号上下文，默认为当前账号
         """
+        self.account = get_account(account)
+        self.log = self.account.log
         self.game_id = game_id
         self.game_mid = game_mid
         self.game_name = game_name
         self.act_id = act_id
         self.player_name = player_name
         self.headers = {}
-        self.http = get_new_session()
+        self.http = self.account.http
 
         self.set_headers()
 
@@ -48,33 +84,49 @@ class GameCheckin:
         headers = setting.headers.copy()
         headers['DS'] = tools.get_ds(web=True)
         headers['Referer'] = 'https://act.mihoyo.com/'
-        headers['Cookie'] = config.config.get("account", {}).get("cookie", "")
-        headers['x-rpc-device_id'] = config.config["device"]["id"]
-        headers['User-Agent'] = tools.get_useragent(config.config["games"]["cn"]["useragent"])
+        headers['Cookie'] = self.account.cookie
+        headers['x-rpc-device_id'] = self.account.device["id"]
+        headers['User-Agent'] = tools.get_useragent(self.account.config["games"]["cn"]["useragent"])
         self.headers = headers
 
     def get_account_list(self) -> list:
         try:
-            account_list = get_account_list(self.game_id, self.headers)
+            account_list = get_account_list(self.game_id, self.headers, account=self.account)
         except CookieError:
-            log.warning(f"获取{self.game_name}账号列表失败！")
-            config.clear_cookie()
-            config.disable_games()
+            self.log.warning(f"获取{self.game_name}账号列表失败！")
+            clear_account_cache(self.account)
+            self.account.clear_cookie()
+            self.account.disable_games()
             raise CookieError("Cookie Error")
         return account_list
 
     # 获取签到信息
     def get_checkin_rewards(self) -> list:
-        log.info("正在获取签到奖励列表...")
+        month, ttl = get_rewards_cache_key()
+        cache_key = f"{self.act_id}:{month}"
+        with _rewards_locks_lock:
+            lock = _rewards_locks.setdefault(self.act_id, threading.Lock())
+        # 多个账号同时执行时只让一个账号去请求，其他账号等待后直接读取缓存
+        with lock:
+            rewards = rewards_cache.get(cache_key)
+            if rewards is not None:
+                return rewards
+            rewards = self.request_checkin_rewards()
+            if rewards:
+                rewards_cache.set(cache_key, rewards, ttl)
+        return rewards
+
+    def request_checkin_rewards(self) -> list:
+        self.log.info("正在获取签到奖励列表...")
         max_retry = 3
         for i in range(max_retry):
             req = self.http.get(self.rewards_api, params={"act_id": self.act_id}, headers=self.headers)
             data = req.json()
             if data["retcode"] == 0:
                 return data["data"]["awards"]
-            log.warning(f"获取签到奖励列表失败，重试次数：{i + 1}")
-            time.sleep(5)  # 等待5秒后重试
-        log.warning("获取签到奖励列表失败")
+            self.log.warning(f"获取签到奖励列表失败，重试次数：{i + 1}")
+            self.account.defer(5, 5)  # 等待5秒后重试
+        self.log.warning("获取签到奖励列表失败")
         return []
 
     # 判断签到
@@ -83,28 +135,31 @@ class GameCheckin:
                             headers=self.headers)
         data = req.json()
         if data["retcode"] != 0:
-            if not update and login.update_cookie_token():
+            if not update and login.update_cookie_token(self.account):
                 self.set_headers()
                 return self.is_sign(region, uid, True)
-            log.warning("获取账号签到信息失败！")
+            self.log.warning("获取账号签到信息失败！")
             print(req.text)
-            config.config["games"]["cn"][self.game_mid]["auto_checkin"] = False
-            config.save_config()
+            self.account.config["games"]["cn"][self.game_mid]["auto_checkin"] = False
+            self.account.save_config()
+            clear_account_cache(self.account)
             raise CookieError("BBS Cookie Errror")
         return data["data"]
 
     def check_in(self, account):
         header = self.headers.copy()
-        retries = config.config['games']['cn'].get('retries', 3)
+        retries = self.account.config['games']['cn'].get('retries', 3)
         result = None
         for i in range(1, retries + 1):
             if i > 1:
-                log.info(f'触发验证码，即将进行第 {i} 次重试，最多 {retries} 次')
+                self.log.info(f'触发验证码，即将进行第 {i} 次重试，最多 {retries} 次')
             result = self.http.post(url=self.sign_api, headers=header,
                                     json={'act_id': self.act_id, 'region': account[2], 'uid': account[1]})
             if result.status_code == 429:
-                time.sleep(10)  # 429同ip请求次数过多，尝试sleep10s进行解决
-                log.warning('429 Too Many Requests，即将进入下一次请求')
+                # 429同ip请求次数过多，限速器会暂停该域名的请求，下一次请求会等待暂停结束
+                self.log.warning('429 Too Many Requests，即将进入下一次请求')
+                if not rate_limiter.enabled:
+                    time.sleep(get_retry_after(result))
                 continue
             data = result.json()
             if data["retcode"] == 0 and data["data"]["success"] == 1 and i < retries:
@@ -121,67 +176,77 @@ class GameCheckin:
                         "x-rpc-validate": validate,
                         "x-rpc-seccode": f'{validate}|jordan'
                     })
-                time.sleep(random.randint(6, 15))
+                self.account.defer(6, 15)
             else:
                 break
         return result
 
-    def sign_account(self) -> str:
-        return_data = f"{self.game_name}: "
+    def sign_account(self) -> TaskResult:
+        result = TaskResult(self.game_name, f"{self.game_name}: ")
         if not self.account_list:
-            log.warning(f"账号没有绑定任何{self.game_name}账号！")
-            return_data += f"\n并没有绑定任何{self.game_name}账号"
-            return return_data
+            self.log.warning(f"账号没有绑定任何{self.game_name}账号！")
+            result.add(None, Status.SKIPPED, f"并没有绑定任何{self.game_name}账号")
+            return result
         for account in self.account_list:
-            if account[1] in config.config["games"]["cn"][self.game_mid]["black_list"]:
+            if account[1] in self.account.config["games"]["cn"][self.game_mid]["black_list"]:
                 continue
-            log.info(f"正在为{self.player_name}「{account[0]}」进行签到...")
-            time.sleep(random.randint(2, 8))
+            ledger_account = f"{self.game_id}:{account[1]}"
+            done_message = self.account.ledger.get_done("checkin", ledger_account)
+            if done_message is not None:
+                self.log.info(f"{self.player_name}「{account[0]}」今天已经签到过了~")
+                result.add(account[0], Status.DONE, done_message)
+                continue
+            self.log.info(f"正在为{self.player_name}「{account[0]}」进行签到...")
+            self.account.defer(2, 8)
             is_data = self.is_sign(region=account[2], uid=account[1])
             if is_data.get("first_bind", False):
-                log.warning(f"{self.player_name}「{account[0]}」是第一次绑定米游社，请先手动签到一次")
+                self.log.warning(f"{self.player_name}「{account[0]}」是第一次绑定米游社，请先手动签到一次")
                 continue
             sign_days = is_data["total_sign_day"] - 1
+            status = Status.DONE
             if is_data["is_sign"]:
-                log.info(f"{self.player_name}「{account[0]}」今天已经签到过了~\r\n今天获得的奖"
-                         f"励是{tools.get_item(self.checkin_rewards[sign_days])}")
+                self.log.info(f"{self.player_name}「{account[0]}」今天已经签到过了~\r\n今天获得的奖"
+                              f"励是{tools.get_item(self.checkin_rewards[sign_days])}")
                 sign_days += 1
             else:
-                time.sleep(random.randint(2, 8))
+                self.account.defer(2, 8)
                 req = self.check_in(account)
                 if req is None:
-                    log.warning("签到失败！")
-                    return_data += f"\n{account[0]}，本次签到失败"
+                    self.log.warning("签到失败！")
+                    result.add(account[0], Status.FAILED, f"{account[0]}，本次签到失败")
                     continue
                 if req.status_code != 429:
                     data = req.json()
                     if data["retcode"] == 0 and data["data"]["success"] == 0:
-                        log.info(
+                        self.log.info(
                             f"{self.player_name}「{account[0]}」签到成功~\r\n今天获得的奖励是"
                             f"{tools.get_item(self.checkin_rewards[0 if sign_days == 0 else sign_days + 1])}")
                         sign_days += 2
+                        status = Status.SUCCESS
                     elif data["retcode"] == -5003:
-                        log.info(
+                        self.log.info(
                             f"{self.player_name}{account[0]}今天已经签到过了~\r\n今天获得的奖励是"
                             f"{tools.get_item(self.checkin_rewards[sign_days])}")
                     else:
                         s = "账号签到失败！"
                         if data["data"] != "" and data.get("data").get("success", -1):
                             s += "原因：验证码\njson 信息：" + req.text
-                        log.warning(s)
-                        return_data += f"\n{account[0]}，触发验证码，本次签到失败"
+                        self.log.warning(s)
+                        result.add(account[0], Status.CAPTCHA, f"{account[0]}，触发验证码，本次签到失败")
                         continue
                 else:
-                    return_data += f"\n{account[0]}，本次签到失败"
+                    result.add(account[0], Status.FAILED, f"{account[0]}，本次签到失败")
                     continue
-            return_data += f"\n{account[0]}已连续签到{sign_days}天\n" \
-                           f"今天获得的奖励是{tools.get_item(self.checkin_rewards[sign_days - 1])}"
-        return return_data
+            message = f"{account[0]}已连续签到{sign_days}天\n" \
+                      f"今天获得的奖励是{tools.get_item(self.checkin_rewards[sign_days - 1])}"
+            result.add(account[0], status, message)
+            self.account.ledger.mark_done("checkin", ledger_account, message)
+        return result
 
 
 class Honkai2(GameCheckin):
-    def __init__(self) -> None:
-        super().__init__("bh2_cn", "honkai2", "崩坏学园2", setting.honkai2_act_id)
+    def __init__(self, account: AccountContext = None) -> None:
+        super().__init__("bh2_cn", "honkai2", "崩坏学园2", setting.honkai2_act_id, account=account)
         self.headers['Referer'] = 'https://webstatic.mihoyo.com/bbs/event/signin/bh2/index.html?bbs_auth_required' \
                                   f'=true&act_id={setting.honkai2_act_id}&bbs_presentation_style=fullscreen' \
                                   '&utm_source=bbs&utm_medium=mys&utm_campaign=icon'
@@ -189,8 +254,8 @@ class Honkai2(GameCheckin):
 
 
 class Honkai3rd(GameCheckin):
-    def __init__(self) -> None:
-        super().__init__("bh3_cn", "honkai3rd", "崩坏3", setting.honkai3rd_act_id, "舰长")
+    def __init__(self, account: AccountContext = None) -> None:
+        super().__init__("bh3_cn", "honkai3rd", "崩坏3", setting.honkai3rd_act_id, "舰长", account=account)
         self.headers['Referer'] = 'https://webstatic.mihoyo.com/bbs/event/signin/bh3/index.html?bbs_auth_required' \
                                   f'=true&act_id={setting.honkai3rd_act_id}&bbs_presentation_style=fullscreen' \
                                   '&utm_source=bbs&utm_medium=mys&utm_campaign=icon'
@@ -198,8 +263,8 @@ class Honkai3rd(GameCheckin):
 
 
 class TearsOfThemis(GameCheckin):
-    def __init__(self) -> None:
-        super().__init__("nxx_cn", "tears_of_themis", "未定事件簿", setting.tearsofthemis_act_id, "律师")
+    def __init__(self, account: AccountContext = None) -> None:
+        super().__init__("nxx_cn", "tears_of_themis", "未定事件簿", setting.tearsofthemis_act_id, "律师", account=account)
         self.headers['Referer'] = 'https://webstatic.mihoyo.com/bbs/event/signin/nxx/index.html?bbs_auth_required' \
                                   '=true&bbs_presentation_style=fullscreen' \
                                   f'act_id={setting.tearsofthemis_act_id}'
@@ -207,23 +272,23 @@ class TearsOfThemis(GameCheckin):
 
 
 class Genshin(GameCheckin):
-    def __init__(self) -> None:
-        super().__init__("hk4e_cn", "genshin", "原神", setting.genshin_act_id, "旅行者")
+    def __init__(self, account: AccountContext = None) -> None:
+        super().__init__("hk4e_cn", "genshin", "原神", setting.genshin_act_id, "旅行者", account=account)
         self.headers["Origin"] = "https://act.mihoyo.com"
         self.headers["x-rpc-signgame"] = "hk4e"
         self.init()
 
 
 class Honkaisr(GameCheckin):
-    def __init__(self):
-        super().__init__("hkrpg_cn", "honkai_sr", "崩坏：星穹铁道", setting.honkai_sr_act_id, "开拓者")
+    def __init__(self, account: AccountContext = None):
+        super().__init__("hkrpg_cn", "honkai_sr", "崩坏：星穹铁道", setting.honkai_sr_act_id, "开拓者", account=account)
         self.headers["Origin"] = "https://act.mihoyo.com"
         self.init()
 
 
 class ZZZ(GameCheckin):
-    def __init__(self):
-        super().__init__("nap_cn", "zzz", "绝区零", setting.zzz_act_id, "绳匠")
+    def __init__(self, account: AccountContext = None):
+        super().__init__("nap_cn", "zzz", "绝区零", setting.zzz_act_id, "绳匠", account=account)
         self.headers["Origin"] = "https://act.mihoyo.com"
         self.headers['X-Rpc-Signgame'] = 'zzz'
         self.rewards_api = setting.zzz_game_checkin_rewards
@@ -232,19 +297,51 @@ class ZZZ(GameCheckin):
         self.init()
 
 
-def checkin_game(game_name, game_module, game_print_name=""):
-    game_config = config.config["games"]["cn"][game_name]
+def checkin_game(game_name, game_module, game_print_name="", account: AccountContext = None):
+    account = get_account(account)
+    game_config = account.config["games"]["cn"][game_name]
     if game_config["checkin"]:
-        time.sleep(random.randint(2, 8))
+        account.defer(2, 8)
         if game_print_name == "":
             game_print_name = game_name
-        log.info(f"正在进行「{game_print_name}」签到")
-        return_data = f"\n\n{game_module().sign_account()}"
-        return return_data
-    return ''
+        account.log.info(f"正在进行「{game_print_name}」签到")
+        return game_module(account).sign_account()
+    return None
+
+
+def checkin_game_paced(game_name, game_module, game_print_name="", account: AccountContext = None):
+    """
+    使用单独的 Pacer 进行签到，同时签到的多个游戏之间的等待互不影响
+    """
+    account = get_account(account).with_pacer(pacing.Pacer())
+    with pacing.use_pacer(account.pacer):
+        return checkin_game(game_name, game_module, game_print_name, account)
+
+
+def checkin_games_parallel(games: list, account: AccountContext = None) -> ResultList:
+    """
+    同时进行多个游戏的签到，每个游戏内部仍保持原有的随机等待，总耗时取决于最慢的游戏
+
+    :param games: [(游戏名称, 配置文件中的游戏名, 签到类)]
+    :param account: 账号上下文，默认为当前账号
+    :return: 按 games 顺序排列的签到结果
+    """
+    account = get_account(account)
+    results = ResultList(prefix="\n\n")
+    games = [game for game in games if account.config["games"]["cn"][game[1]]["checkin"]]
+    if not games:
+        return results
+    with ThreadPoolExecutor(max_workers=len(games), thread_name_prefix="game") as executor:
+        # 账号显式传入，线程池不会继承 contextvars，仍复制一份当前上下文给没有传入账号的代码使用
+        futures = [executor.submit(contextvars.copy_context().run, checkin_game_paced, game_name, game_module,
+                                   game_print_name, account)
+                   for game_print_name, game_name, game_module in games]
+    results.extend(future.result() for future in futures)
+    return results
 
 
-def run_task():
+def run_task(account: AccountContext = None) -> ResultList:
+    account = get_account(account)
     games = [
         ("崩坏学园2", "honkai2", Honkai2),
         ("崩坏3rd", "honkai3rd", Honkai3rd),
@@ -253,7 +350,12 @@ def run_task():
         ("崩坏：星穹铁道", "honkai_sr", Honkaisr),
         ("绝区零", "zzz", ZZZ)
     ]
-    return_data = ''
+    # 设置环境变量 AutoMihoyoBBS_game_parallel=1 后同一个账号的多个游戏同时签到
+    if os.getenv("AutoMihoyoBBS_game_parallel") == "1":
+        return checkin_games_parallel(games, account)
+    results = ResultList(prefix="\n\n")
     for game_print_name, game_name, game_module in games:
-        return_data += checkin_game(game_name, game_module, game_print_name)
-    return return_data
+        result = checkin_game(game_name, game_module, game_print_name, account)
+        if result is not None:
+            results.append(result)
+    return results
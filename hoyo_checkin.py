@@ -1,31 +1,39 @@
-import time
-import random
+import re
 import setting
-import config
-from request import get_new_session
-from loghelper import log
+from context import AccountContext, get_account
+from request import get_shared_async_session
+from result import Status, TaskResult, ResultList
 
 RET_CODE_ALREADY_SIGNED_IN = -5003
 
+# 配置文件中的游戏名 -> (游戏名称, 基础Url, 活动id)
+game_list = {
+    "genshin": ("原神", "https://sg-hk4e-api.hoyolab.com/event/sol", setting.os_genshin_act_id),
+    "honkai_sr": ("崩坏：星穹铁道", "https://sg-public-api.hoyolab.com/event/luna/os", setting.os_honkai_sr_act_id),
+    "honkai3rd": ("崩坏3", "https://sg-public-api.hoyolab.com/event/mani", setting.os_honkai3rd_act_id),
+    "tears_of_themis": ("未定事件簿", "https://sg-public-api.hoyolab.com/event/luna/os",
+                        setting.os_tearsofthemis_act_id),
+    "zzz": ("绝区零", "https://sg-act-nap-api.hoyolab.com/event/luna/zzz/os", setting.os_zzz_act_id),
+}
 
-def hoyo_checkin(event_base_url: str, act_id: str) -> str:
+
+def get_checkin_request(event_base_url: str, act_id: str, account: AccountContext = None) -> tuple:
     """
-    国际服游戏签到
+    生成签到所需的Url和请求头
 
     :param event_base_url: 基础Url
     :param act_id: 活动id
-    :return: 签到结果
+    :return: (奖励Url, 签到信息Url, 签到Url, 请求头)
     """
-    os_lang = config.config["games"]["os"]["lang"]
+    account = get_account(account)
+    os_lang = account.config["games"]["os"]["lang"]
     reward_url = f"{event_base_url}/home?lang={os_lang}" \
                  f"&act_id={act_id}"
     info_url = f"{event_base_url}/info?lang={os_lang}" \
                f"&act_id={act_id}"
     sign_url = f"{event_base_url}/sign?lang={os_lang}"
 
-    http = get_new_session()
-
-    cookie_str = config.config.get("games", {}).get("os", {}).get("cookie", "")
+    cookie_str = account.config.get("games", {}).get("os", {}).get("cookie", "")
 
     headers = {
         "Referer": setting.os_referer_url,
@@ -34,109 +42,234 @@ def hoyo_checkin(event_base_url: str, act_id: str) -> str:
     }
     if act_id == setting.os_zzz_act_id:
         headers['x-rpc-signgame'] = "zzz"
+    return reward_url, info_url, sign_url, headers
 
-    info_list = http.get(info_url, headers=headers).json()
 
-    today = info_list.get("data", {}).get("today")
-    total_sign_in_day = info_list.get("data", {}).get("total_sign_day")
+def check_sign_info(info_list: dict, account: AccountContext = None):
+    """
+    检查签到信息，判断是否还需要签到
+
+    :param info_list: 签到信息
+    :return: 不需要签到时返回 (状态, 提示信息)，否则返回None
+    """
+    account = get_account(account)
     already_signed_in = info_list.get("data", {}).get("is_sign")
     first_bind = info_list.get("data", {}).get("first_bind")
 
     if already_signed_in:
-        log.info("今天已经签到过")
-        ret_msg = "今天已经签到过"
-        return ret_msg
+        account.log.info("今天已经签到过")
+        return Status.DONE, "今天已经签到过"
 
     if first_bind:
-        log.info("请手动签到一次")
-        ret_msg = "请手动签到一次"
-        return ret_msg
+        account.log.info("请手动签到一次")
+        return Status.SKIPPED, "请手动签到一次"
+    return None
+
+
+def get_sign_result(response: dict, awards: list, total_sign_in_day: int, account: AccountContext = None) -> tuple:
+    """
+    处理签到结果
+
+    :param response: 签到接口返回的数据
+    :param awards: 奖励列表
+    :param total_sign_in_day: 签到前的累计签到天数
+    :return: (状态, 签到结果)
+    """
+    account = get_account(account)
+    code = response.get("retcode", 99999)
+
+    account.log.debug(f"return code {code}")
+
+    if code == RET_CODE_ALREADY_SIGNED_IN:
+        account.log.info("今天已经签到过")
+        return Status.DONE, "今天已经签到过"
+    elif code != 0:
+        account.log.error(response['message'])
+        return Status.FAILED, response['message']
+
+    reward = awards[total_sign_in_day - 1]
+
+    account.log.info("签到成功")
+    account.log.info(f"\t已连续签到 {total_sign_in_day + 1} 天")
+    account.log.info(f"\t今天获得的奖励是：{reward['cnt']}x 「{reward['name']}」")
+    return Status.SUCCESS, f"\t今天获得的奖励是：{reward['cnt']}x 「{reward['name']}」"
+
+
+def hoyo_checkin(event_base_url: str, act_id: str, account: AccountContext = None) -> tuple:
+    """
+    国际服游戏签到
+
+    :param event_base_url: 基础Url
+    :param act_id: 活动id
+    :return: (状态, 签到结果)
+    """
+    account = get_account(account)
+    reward_url, info_url, sign_url, headers = get_checkin_request(event_base_url, act_id, account)
+
+    http = account.http
+
+    info_list = http.get(info_url, headers=headers).json()
+
+    sign_info = check_sign_info(info_list, account)
+    if sign_info is not None:
+        return sign_info
+
+    today = info_list.get("data", {}).get("today")
+    total_sign_in_day = info_list.get("data", {}).get("total_sign_day")
 
     awards_data = http.get(reward_url, headers=headers).json()
 
     awards = awards_data.get("data", {}).get("awards")
 
-    log.info(f"准备签到：{today} ")
+    account.log.info(f"准备签到：{today} ")
 
     # a normal human can't instantly click, so we wait a bit
-    sleep_time = random.uniform(2.0, 10.0)
-    log.debug(f"等待 {sleep_time}")
-    time.sleep(sleep_time)
+    account.defer(2.0, 10.0)
 
     response = http.post(sign_url, headers=headers, json={"act_id": act_id}).json()
+    return get_sign_result(response, awards, total_sign_in_day, account)
+    # logging.info(f"\tMessage: {response['message']}")
 
-    code = response.get("retcode", 99999)
 
-    log.debug(f"return code {code}")
+async def hoyo_checkin_async(event_base_url: str, act_id: str, account: AccountContext = None) -> tuple:
+    """
+    国际服游戏签到（异步）
 
-    if code == RET_CODE_ALREADY_SIGNED_IN:
-        log.info("今天已经签到过")
-        ret_msg = "今天已经签到过"
-        return ret_msg
-    elif code != 0:
-        log.error(response['message'])
-        ret_msg = response['message']
-        return ret_msg
+    :param event_base_url: 基础Url
+    :param act_id: 活动id
+    :return: (状态, 签到结果)
+    """
+    account = get_account(account)
+    reward_url, info_url, sign_url, headers = get_checkin_request(event_base_url, act_id, account)
 
-    reward = awards[total_sign_in_day - 1]
+    with account.paced():
+        http = get_shared_async_session()
+        info_list = (await http.get(info_url, headers=headers)).json()
 
-    log.info("签到成功")
-    log.info(f"\t已连续签到 {total_sign_in_day + 1} 天")
-    log.info(f"\t今天获得的奖励是：{reward['cnt']}x 「{reward['name']}」")
-    ret_msg = f"\t今天获得的奖励是：{reward['cnt']}x 「{reward['name']}」"
-    return ret_msg
-    # logging.info(f"\tMessage: {response['message']}")
+        sign_info = check_sign_info(info_list, account)
+        if sign_info is not None:
+            return sign_info
+
+        today = info_list.get("data", {}).get("today")
+        total_sign_in_day = info_list.get("data", {}).get("total_sign_day")
 
+        awards_data = (await http.get(reward_url, headers=headers)).json()
 
-def genshin():
-    log.info(f"正在进行「原神」签到")
-    ret_msg = '原神：\n' + hoyo_checkin("https://sg-hk4e-api.hoyolab.com/event/sol",
-                                     setting.os_genshin_act_id)
-    return ret_msg
+        awards = awards_data.get("data", {}).get("awards")
 
+        account.log.info(f"准备签到：{today} ")
 
-def honkai_sr():
-    log.info(f"正在进行「崩坏：星穹铁道」签到")
-    ret_msg = '崩坏：星穹铁道：\n' + hoyo_checkin("https://sg-public-api.hoyolab.com/event/luna/os",
-                                          setting.os_honkai_sr_act_id)
-    return ret_msg
+        account.defer(2.0, 10.0)
 
+        response = (await http.post(sign_url, headers=headers, json={"act_id": act_id})).json()
+    return get_sign_result(response, awards, total_sign_in_day, account)
+
+
+def get_ledger_account(game: str, account: AccountContext = None):
+    """
+    获取国际服账号在每日记录中的标识
+
+    :return: 游戏:HoYoLAB uid，cookie 中没有 uid 时返回 None
+    """
+    account = get_account(account)
+    uid_match = re.search(r"(?:ltuid_v2|ltuid|account_id_v2|account_id)=(\d+)", account.config['games']['os']['cookie'])
+    if uid_match is None:
+        return None
+    return f"{game}:{uid_match.group(1)}"
+
+
+def get_done_result(game: str, account: AccountContext = None):
+    """
+    今天已经签到过时直接返回记录的结果，不需要请求接口
+    """
+    account = get_account(account)
+    game_name = game_list[game][0]
+    done_message = account.ledger.get_done("os_checkin", get_ledger_account(game, account))
+    if done_message is None:
+        return None
+    account.log.info(f"「{game_name}」今天已经签到过")
+    result = TaskResult(game_name, f'{game_name}：')
+    result.add(None, Status.DONE, done_message)
+    return result
 
-def honkai3rd():
-    log.info(f"正在进行「崩坏3」签到")
-    ret_msg = '崩坏3：\n' + hoyo_checkin("https://sg-public-api.hoyolab.com/event/mani",
-                                      setting.os_honkai3rd_act_id)
-    return ret_msg
 
+def get_checkin_result(game: str, status: Status, message: str, account: AccountContext = None) -> TaskResult:
+    account = get_account(account)
+    game_name = game_list[game][0]
+    result = TaskResult(game_name, f'{game_name}：')
+    result.add(None, status, message)
+    if status in (Status.SUCCESS, Status.DONE):
+        account.ledger.mark_done("os_checkin", get_ledger_account(game, account), message)
+    return result
 
-def tears_of_themis():
-    log.info(f"正在进行「未定事件簿」签到")
-    ret_msg = '未定事件簿：\n' + hoyo_checkin("https://sg-public-api.hoyolab.com/event/luna/os",
-                                        setting.os_tearsofthemis_act_id)
-    return ret_msg
 
-def zzz():
-    log.info(f"正在进行「绝区零」签到")
-    ret_msg = '绝区零：\n' + hoyo_checkin("https://sg-act-nap-api.hoyolab.com/event/luna/zzz/os",
-                                      setting.os_zzz_act_id)
-    return ret_msg
+def checkin_game(game: str, account: AccountContext = None) -> TaskResult:
+    account = get_account(account)
+    result = get_done_result(game, account)
+    if result is not None:
+        return result
+    game_name, event_base_url, act_id = game_list[game]
+    account.log.info(f"正在进行「{game_name}」签到")
+    return get_checkin_result(game, *hoyo_checkin(event_base_url, act_id, account), account)
 
 
-def run_task():
-    ret_msg = ''
-    games = config.config['games']['os']
+async def checkin_game_async(game: str, account: AccountContext = None) -> TaskResult:
+    account = get_account(account)
+    result = get_done_result(game, account)
+    if result is not None:
+        return result
+    game_name, event_base_url, act_id = game_list[game]
+    account.log.info(f"正在进行「{game_name}」签到")
+    return get_checkin_result(game, *await hoyo_checkin_async(event_base_url, act_id, account), account)
+
+
+def genshin(account: AccountContext = None):
+    return checkin_game("genshin", account)
+
+
+def honkai_sr(account: AccountContext = None):
+    return checkin_game("honkai_sr", account)
+
+
+def honkai3rd(account: AccountContext = None):
+    return checkin_game("honkai3rd", account)
+
+
+def tears_of_themis(account: AccountContext = None):
+    return checkin_game("tears_of_themis", account)
+
+
+def zzz(account: AccountContext = None):
+    return checkin_game("zzz", account)
+
+
+def get_checkin_games(account: AccountContext = None) -> list:
+    """
+    获取需要签到的游戏列表
+
+    :return: 配置文件中的游戏名列表，未配置 Cookie 时返回空列表
+    """
+    account = get_account(account)
+    games = account.config['games']['os']
 
     if games['cookie'] == '':
-        log.warning("国际服未配置 Cookie！")
+        account.log.warning("国际服未配置 Cookie！")
         games['enable'] = False
-        config.save_config()
-        return ''
+        account.save_config()
+        return []
+
+    return [game for game, data in games.items()
+            if isinstance(data, dict) and data.get('checkin', False) and game in game_list]
+
+
+def run_task(account: AccountContext = None) -> ResultList:
+    account = get_account(account)
+    return ResultList((checkin_game(game, account) for game in get_checkin_games(account)), prefix="\n\n")
 
-    for game, data in games.items():
-        if isinstance(data, dict) and data.get('checkin', False):
-            try:
-                ret_msg += f"\n\n{globals()[game]()}"
-            except KeyError:
-                pass
 
-    return ret_msg
+async def run_task_async(account: AccountContext = None) -> ResultList:
+    account = get_account(account)
+    results = ResultList(prefix="\n\n")
+    for game in get_checkin_games(account):
+        results.append(await checkin_game_async(game, account))
+    return results
@@ -3,6 +3,7 @@ import push
 import config
 import main_multi
 from error import CookieError
+from metrics import request_metrics
 
 
 def main_handler(event: dict, context: dict):
@@ -11,6 +12,7 @@ def main_handler(event: dict, context: dict):
         status_code, push_message = main.main()
     except CookieError:
         status_code = 0
+    request_metrics.dump()
     push.push(status_code, push_message)
     print("云函数测试支持！")
     return 0
@@ -0,0 +1,68 @@
+import os
+import atexit
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from cache import FileCache
+
+# 每天已完成的任务，按北京时间的日期记录，同一天再次运行时直接跳过，不再请求接口
+# 设置环境变量 AutoMihoyoBBS_ledger=0 关闭
+ledger_enable = os.getenv("AutoMihoyoBBS_ledger", "1") != "0"
+ledger_cache = FileCache("daily_ledger", 86400)
+
+
+def get_today() -> tuple:
+    """
+    获取北京时间的日期以及到第二天的剩余秒数
+
+    :return: (日期, 剩余秒数)
+    """
+    now = datetime.now(timezone(timedelta(hours=8)))
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return now.strftime("%Y-%m-%d"), int((tomorrow - now).total_seconds()) + 1
+
+
+def get_token_id(token: str) -> str:
+    """
+    没有 uid 的账号（如云游戏）用 token 的摘要区分，避免 token 明文写入文件
+    """
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def get_done(task: str, account: str):
+    """
+    查询任务今天是否已经完成
+
+    :param task: 任务名称
+    :param account: 账号标识，如游戏 uid
+    :return: 已完成时返回记录的结果信息，否则返回 None
+    """
+    if not ledger_enable or not account:
+        return None
+    record = ledger_cache.get(f"{task}:{account}")
+    if record is None or record["date"] != get_today()[0]:
+        return None
+    return record["message"]
+
+
+def mark_done(task: str, account: str, message: str) -> None:
+    """
+    记录任务今天已经完成，记录只保存在内存中，由 save 统一写入文件
+
+    :param task: 任务名称
+    :param account: 账号标识，如游戏 uid
+    :param message: 再次运行时显示的结果信息
+    """
+    if not ledger_enable or not account:
+        return
+    today, ttl = get_today()
+    # 同一个任务每天覆盖同一个 key，文件大小不会随天数增长
+    ledger_cache.set(f"{task}:{account}", {"date": today, "message": message}, ttl, save=False)
+
+
+def save() -> None:
+    if ledger_enable:
+        ledger_cache.save()
+
+
+atexit.register(save)
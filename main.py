@@ -1,21 +1,15 @@
-import os
-import time
-import random
 from typing import Tuple, Optional
-from enum import Enum, auto
+from enum import Enum
 
-import push
-import login
 import tools
+import ledger
+import request
 import config
-import mihoyobbs
-import cloudgames
-import gamecheckin
-import hoyo_checkin
-import web_activity
-import os_cloudgames
 from loghelper import log
-from error import CookieError, StokenError
+from metrics import request_metrics
+from result import Status, TaskResult, ResultList
+from context import AccountContext, get_account
+from error import CookieError, StokenError, ConfigError
 
 
 class StatusCode(Enum):
@@ -33,73 +27,139 @@ def check_github_actions() -> None:
 
 def initialize_config() -> Tuple[bool, Optional[str]]:
     """初始化配置"""
-    config.load_config()
+    try:
+        config.load_config()
+    except ConfigError as e:
+        log.error(e.info)
+        return False, e.info
     if not config.config["enable"]:
         log.warning("Config 未启用！")
         return False, "Config 未启用！"
     return True, None
 
 
-def handle_login() -> None:
+def handle_login(account: AccountContext) -> None:
     """处理登录逻辑"""
-    account_cfg = config.config["account"]
+    account_cfg = account.config["account"]
     if any([
         account_cfg["stuid"] == "",
         account_cfg["stoken"] == "",
         account_cfg["mid"] == ""
     ]):
-        if config.config["mihoyobbs"]["enable"]:
-            login.login()
-            time.sleep(random.randint(3, 8))
+        if account.config["mihoyobbs"]["enable"]:
+            import login
+
+            login.login(account)
+            account.defer(3, 8)
         account_cfg["cookie"] = tools.tidy_cookie(account_cfg["cookie"])
 
 
-def run_mihoyobbs() -> Tuple[str, bool]:
+def run_mihoyobbs(account: AccountContext) -> Tuple[Optional[TaskResult], bool]:
     """执行米游社签到任务"""
-    return_data = ""
+    return_data = None
     raise_stoken = False
 
-    if config.config["mihoyobbs"]["enable"]:
-        if config.config["account"]["stoken"] == "StokenError":
-            return_data = "米游社：\n账号 Stoken 异常"
+    if account.config["mihoyobbs"]["enable"]:
+        if account.config["account"]["stoken"] == "StokenError":
+            return_data = TaskResult("米游社", "米游社：")
+            return_data.add(None, Status.FAILED, "账号 Stoken 异常")
             raise_stoken = True
         else:
+            stuid = account.config["account"]["stuid"]
+            done_message = account.ledger.get_done("mihoyobbs", stuid)
+            if done_message is not None:
+                account.log.info("今天的米游社任务已经全部完成，跳过")
+                return_data = TaskResult("米游社", "米游社: ")
+                return_data.add(None, Status.DONE, done_message)
+                return return_data, raise_stoken
             try:
-                bbs = mihoyobbs.Mihoyobbs()
+                import mihoyobbs
+
+                bbs = mihoyobbs.Mihoyobbs(account)
                 return_data = bbs.run_task()
             except StokenError:
                 raise_stoken = True
+            else:
+                if bbs.today_get_coins == 0:
+                    account.ledger.mark_done("mihoyobbs", stuid, return_data.accounts[-1].message)
     return return_data, raise_stoken
 
 
-def run_cn_tasks() -> str:
+def run_cn_tasks(account: AccountContext) -> ResultList:
     """执行国服任务"""
-    result = []
-    if config.config["games"]['cn']["enable"]:
-        result.append(gamecheckin.run_task())
-    if config.config["cloud_games"]['cn']["enable"]:
-        log.info("正在进行云游戏签到")
-        result.append(cloudgames.run_task())
-    return "\n\n".join(filter(None, result))
+    result = ResultList(separator="\n\n")
+    if account.config["games"]['cn']["enable"]:
+        import gamecheckin
+
+        result.append(gamecheckin.run_task(account))
+    if account.config["cloud_games"]['cn']["enable"]:
+        import cloudgames
+
+        account.log.info("正在进行云游戏签到")
+        result.append(cloudgames.run_task(account))
+    return result
 
 
-def run_os_tasks() -> str:
+def run_os_tasks(account: AccountContext) -> ResultList:
     """执行国际服任务"""
-    result = []
-    if config.config["games"]['os']["enable"]:
-        log.info("海外版：")
-        os_result = hoyo_checkin.run_task()
+    result = ResultList(separator="\n\n")
+    if account.config["games"]['os']["enable"]:
+        import hoyo_checkin
+
+        account.log.info("海外版：")
+        os_result = hoyo_checkin.run_task(account)
+        if os_result:
+            os_result.header = "海外版："
+            result.append(os_result)
+    if account.config["cloud_games"]['os']["enable"]:
+        import os_cloudgames
+
+        account.log.info("正在进行云游戏国际版签到")
+        result.append(os_cloudgames.run_task(account))
+    return result
+
+
+async def run_cn_tasks_async(account: AccountContext) -> ResultList:
+    """执行国服任务（异步）"""
+    import asyncio
+
+    result = ResultList(separator="\n\n")
+    if account.config["games"]['cn']["enable"]:
+        import gamecheckin
+
+        result.append(await asyncio.to_thread(gamecheckin.run_task, account))
+    if account.config["cloud_games"]['cn']["enable"]:
+        import cloudgames
+
+        account.log.info("正在进行云游戏签到")
+        result.append(await cloudgames.run_task_async(account))
+    return result
+
+
+async def run_os_tasks_async(account: AccountContext) -> ResultList:
+    """执行国际服任务（异步）"""
+    result = ResultList(separator="\n\n")
+    if account.config["games"]['os']["enable"]:
+        import hoyo_checkin
+
+        account.log.info("海外版：")
+        os_result = await hoyo_checkin.run_task_async(account)
         if os_result:
-            result.append(f"海外版：{os_result}")
-    if config.config["cloud_games"]['os']["enable"]:
-        log.info("正在进行云游戏国际版签到")
-        result.append(os_cloudgames.run_task())
-    return "\n\n".join(filter(None, result))
+            os_result.header = "海外版："
+            result.append(os_result)
+    if account.config["cloud_games"]['os']["enable"]:
+        import os_cloudgames
+
+        account.log.info("正在进行云游戏国际版签到")
+        result.append(await os_cloudgames.run_task_async(account))
+    return result
 
 
 def run_web_activity() -> None:
     """执行网页活动任务"""
     if config.config["web_activity"]['enable']:
+        import web_activity
+
         log.info("正在进行米游社网页活动任务")
         web_activity.run_task()
 
@@ -112,31 +172,80 @@ def main() -> Tuple[int, str]:
     if not success:
         return StatusCode.FAILURE.value, msg
 
-    handle_login()
+    account = get_account()
+    try:
+        handle_login(account)
 
-    if config.config["account"]["cookie"] == "CookieError":
-        raise CookieError('Cookie expires')
+        if account.config["account"]["cookie"] == "CookieError":
+            raise CookieError('Cookie expires')
 
-    return_data = []
-    status_code = StatusCode.SUCCESS.value
+        return_data = []
 
-    # 执行各模块任务
-    mihoyo_result, raise_stoken = run_mihoyobbs()
-    return_data.append(mihoyo_result)
+        # 执行各模块任务
+        mihoyo_result, raise_stoken = run_mihoyobbs(account)
+        return_data.append(mihoyo_result)
 
-    return_data.append(run_cn_tasks())
-    return_data.append(run_os_tasks())
+        return_data.append(run_cn_tasks(account))
+        return_data.append(run_os_tasks(account))
 
-    run_web_activity()
+        run_web_activity()
 
+        return get_result(return_data, raise_stoken)
+    finally:
+        # Cookie/Stoken 出错时也要写入已经清除的 Cookie
+        config.flush_config()
+
+
+def get_result(return_data: list, raise_stoken: bool) -> Tuple[int, ResultList]:
+    """汇总各模块的执行结果，返回执行结果本身，推送时才渲染为文本"""
+    ledger.save()
     if raise_stoken:
         raise StokenError("Stoken 异常")
 
-    result_msg = "\n".join(filter(None, return_data))
-    if "触发验证码" in result_msg:
+    return_data = [i for i in return_data if i]
+    status_code = StatusCode.SUCCESS.value
+    result = ResultList(return_data, separator="\n")
+    if result.captcha:
         status_code = StatusCode.CAPTCHA_TRIGGERED.value
 
-    return status_code, result_msg
+    return status_code, result
+
+
+async def main_async() -> Tuple[int, str]:
+    """
+    主执行函数（异步）
+
+    云游戏和国际服签到直接在事件循环上等待网络请求，
+    米游社和国服游戏签到仍是阻塞实现，放到线程中执行，配置上下文会随之传递
+    """
+    import asyncio
+
+    check_github_actions()
+
+    success, msg = await asyncio.to_thread(initialize_config)
+    if not success:
+        return StatusCode.FAILURE.value, msg
+
+    account = get_account()
+    try:
+        await asyncio.to_thread(handle_login, account)
+
+        if account.config["account"]["cookie"] == "CookieError":
+            raise CookieError('Cookie expires')
+
+        return_data = []
+
+        mihoyo_result, raise_stoken = await asyncio.to_thread(run_mihoyobbs, account)
+        return_data.append(mihoyo_result)
+
+        return_data.append(await run_cn_tasks_async(account))
+        return_data.append(await run_os_tasks_async(account))
+
+        await asyncio.to_thread(run_web_activity)
+
+        return get_result(return_data, raise_stoken)
+    finally:
+        await asyncio.to_thread(config.flush_config)
 
 
 def task_run() -> None:
@@ -154,6 +263,10 @@ def task_run() -> None:
         push_message = f"账号 Stoken 出错！\n{message}"
         log.error("账号 Stoken 有问题！")
 
+    import push
+
+    log.info(request.pool_stats.summary())
+    request_metrics.dump()
     push.push(status_code, push_message)
 
 
@@ -1,13 +1,22 @@
 import os
 import sys
 import main
-import time
 import push
+import queue
+import fleet
 import config
-import random
+import pacing
+import request
+from concurrent.futures import ThreadPoolExecutor
 from loghelper import log
+from metrics import request_metrics
+from result import Status, ResultList, account_status_text
+from context import AccountContext
 from error import CookieError, StokenError
 
+# 账号单独配置的推送，在所有账号执行完毕后按推送配置文件合并推送
+push_batch = push.PushBatch()
+
 
 def find_config(ext: str) -> list:
     """
@@ -50,13 +59,18 @@ def get_config_list() -> list:
     """
     获取所有可用的配置文件列表
     
-    搜索 .yaml 和 .yml 文件，并根据环境变量判断是否使用青龙面板模式
+    搜索 .yaml 和 .yml 文件，并根据环境变量判断是否使用青龙面板模式，
+    启用账号库时返回账号库中的账号名
     
     Returns:
         list: 配置文件列表
     """
-    config_list = find_config('.yaml')
-    config_list.extend(find_config('.yml'))
+    if fleet.fleet_enable:
+        log.info(f"正在从账号库 {fleet.fleet_path} 读取账号")
+        config_list = fleet.fleet_store.list_names(config.config_prefix)
+    else:
+        config_list = find_config('.yaml')
+        config_list.extend(find_config('.yml'))
     # 增强环境变量处理，添加更多的错误处理和默认值
     config_prefix = os.getenv("AutoMihoyoBBS_config_prefix")
     config_multi = os.getenv("AutoMihoyoBBS_config_multi", "0")
@@ -72,22 +86,182 @@ def get_config_list() -> list:
     return config_list
 
 
-def main_multi(autorun: bool) -> tuple:
+def get_workers(argv: list = None) -> int:
     """
-    多用户模式主执行函数
-    
-    依次执行所有配置文件的任务，并汇总结果
-    
+    获取同时执行的账号数量
+
+    命令行参数 --workers N / --workers=N 优先，其次是环境变量 AutoMihoyoBBS_multi_workers，默认为 1（依次执行）
+
     Args:
-        autorun (bool): 是否自动运行，False 时会等待用户确认
-    
+        argv (list): 命令行参数列表，默认为 sys.argv
+
     Returns:
-        tuple: (状态码, 推送消息)
-            状态码：
-            0 - 全部成功
-            1 - 全部失败
-            2 - 部分失败
-            3 - 有验证码触发
+        int: 同时执行的账号数量
+    """
+    if argv is None:
+        argv = sys.argv
+    workers = os.getenv("AutoMihoyoBBS_multi_workers", "1")
+    for index, arg in enumerate(argv):
+        if arg.startswith("--workers="):
+            workers = arg.split("=", 1)[1]
+        elif arg == "--workers" and index + 1 < len(argv):
+            workers = argv[index + 1]
+    try:
+        return max(int(workers), 1)
+    except ValueError:
+        log.warning(f"并发数量设置错误：{workers}，将依次执行")
+        return 1
+
+
+def get_account_name(file_name: str) -> str:
+    return file_name.replace('.yaml', '').replace('config', '主账号').replace('account', '账号')
+
+
+def get_error_result(account_name: str, e: Exception) -> tuple:
+    """
+    处理账号 Cookie/Stoken 出错的情况，配置了账号单独推送时加入 push_batch，执行完毕后合并推送
+
+    Returns:
+        tuple: (结果分类, 该账号的详细信息)
+    """
+    error_msg = "账号 Cookie 出错！" if isinstance(e, CookieError) else "账号 Stoken 有问题！"
+    if config.config.get("push", "") != "":
+        push_batch.add(config.config["push"], 1, f"【{account_name}】\n{error_msg}")
+    return "error", get_account_report(account_name, Status.FAILED, [error_msg])
+
+
+def get_account_report(account_name: str, status: Status, results: list = ()) -> ResultList:
+    """
+    生成汇总中一个账号的结果，标题和状态行由账号名称和状态生成，推送服务可以直接读取这两个字段
+
+    Args:
+        account_name (str): 账号名称
+        status (Status): 该账号的执行状态
+        results (list): 该账号的执行结果
+    """
+    return ResultList(results, header=f"【{account_name}】\n{account_status_text[status]}", prefix="\n",
+                      name=account_name, status=status)
+
+
+def get_account_result(account_name: str, run_code: int, run_message: str) -> tuple:
+    """
+    根据 main.main 的返回值对账号进行分类
+
+    Returns:
+        tuple: (结果分类, 该账号的详细信息)
+            结果分类为 ok/close/error/captcha 之一
+    """
+    # 增强对返回值的处理，确保所有可能的情况都被考虑到
+    if run_code == 0:
+        return "ok", get_account_report(account_name, Status.SUCCESS, [run_message])
+    elif run_code == 1 or run_code == 2:
+        # 处理明确的失败状态
+        return "error", get_account_report(account_name, Status.FAILED, [run_message])
+    elif run_code == 3:
+        return "captcha", get_account_report(account_name, Status.CAPTCHA, [run_message])
+    # 其他未知状态归类为未执行
+    return "close", get_account_report(account_name, Status.SKIPPED)
+
+
+def get_config_context(file_name: str) -> config.ConfigContext:
+    """
+    创建账号的配置上下文，启用账号库时从账号库读写，否则读写 config 目录下的配置文件
+
+    Args:
+        file_name (str): 配置文件名/账号名
+    """
+    if fleet.fleet_enable:
+        return config.ConfigContext(file_name, store=fleet.fleet_store)
+    return config.ConfigContext(os.path.join(config.path, file_name))
+
+
+def account_exists(file_name: str) -> bool:
+    """
+    判断账号是否存在，与 get_config_context 一致，启用账号库时查找账号库，否则查找 config 目录
+
+    Args:
+        file_name (str): 配置文件名/账号名
+    """
+    if fleet.fleet_enable:
+        return file_name in fleet.fleet_store.list_names(file_name)
+    return os.path.exists(os.path.join(config.path, file_name))
+
+
+def run_account(file_name: str, pacer: pacing.Pacer = None) -> tuple:
+    """
+    执行单个配置文件的任务
+
+    每个账号使用独立的账号上下文，可以在多个线程中同时调用，日志前会加上账号名
+
+    Args:
+        file_name (str): 配置文件名
+        pacer (pacing.Pacer): 该账号使用的请求节奏，为 None 时新建
+
+    Returns:
+        tuple: (结果分类, 该账号的详细信息)
+    """
+    log.info(f"正在执行 {file_name}")
+    account_name = get_account_name(file_name)
+    account = AccountContext(get_config_context(file_name), account_name, pacer=pacer or pacing.Pacer())
+    with account.bind():
+        # 配置在 main.main 中加载，出错时用于推送消息的配置也已经加载
+        try:
+            run_code, run_message = main.main()
+        except (CookieError, StokenError) as e:
+            result = get_error_result(account_name, e)
+        else:
+            result = get_account_result(account_name, run_code, run_message)
+    log.info(f"{file_name} 执行完毕")
+    return result
+
+
+def run_account_paced(file_name: str, pacers: queue.Queue) -> tuple:
+    """
+    执行单个配置文件的任务，执行完毕后同一个 Pacer 的下一个账号至少随机等待一段时间再发出请求
+
+    等待只推迟下一个账号的第一个请求，读取配置等准备工作不需要等待
+
+    Args:
+        pacers (queue.Queue): Pacer 池，数量与同时执行的账号数量一致
+    """
+    pacer = pacers.get()
+    try:
+        return run_account(file_name, pacer)
+    finally:
+        pacer.defer(3, 10)
+        pacers.put(pacer)
+
+
+async def run_account_async(file_name: str, pacers: "asyncio.Queue") -> tuple:
+    """
+    执行单个配置文件的任务（异步），Pacer 池同时用于限制并发数量，执行完毕后的等待与 run_account_paced 一致
+
+    每个协程拥有独立的 contextvars 上下文，配置上下文互不影响
+    """
+    import asyncio
+
+    pacer = await pacers.get()
+    try:
+        log.info(f"正在执行 {file_name}")
+        account_name = get_account_name(file_name)
+        account = AccountContext(get_config_context(file_name), account_name, pacer=pacer)
+        with account.bind():
+            try:
+                run_code, run_message = await main.main_async()
+            except (CookieError, StokenError) as e:
+                result = await asyncio.to_thread(get_error_result, account_name, e)
+            else:
+                result = get_account_result(account_name, run_code, run_message)
+        log.info(f"{file_name} 执行完毕")
+    finally:
+        pacer.defer(3, 10)
+        pacers.put_nowait(pacer)
+    return result
+
+
+def prepare_config_list(autorun: bool) -> list:
+    """
+    搜索配置文件，非自动运行时等待用户确认
     """
     log.info("AutoMihoyoBBS Multi User mode")
     log.info("正在搜索配置文件！")
@@ -100,45 +274,26 @@ def main_multi(autorun: bool) -> tuple:
             input("请输入回车继续，需要重新搜索配置文件请 Ctrl+C 退出脚本")
         except KeyboardInterrupt:
             exit(0)
-    results = {"ok": [], "close": [], "error": [], "captcha": []}
-    detailed_messages = []  # 存储每个账号的详细签到信息
+    return config_list
 
-    for i in config_list:
-        log.info(f"正在执行 {i}")
-        config.config_Path = os.path.join(config.path, i)
 
-        # 获取账号配置用于推送消息
-        config.load_config(config.config_Path)
-        account_name = i.replace('.yaml', '').replace('config', '主账号').replace('account', '账号')
+def get_summary(config_list: list, account_results) -> tuple:
+    """
+    汇总所有账号的执行结果
 
-        try:
-            run_code, run_message = main.main()
-        except (CookieError, StokenError) as e:
-            results["error"].append(i)
-            error_msg = "账号 Cookie 出错！" if isinstance(e, CookieError) else "账号 Stoken 有问题！"
-            detailed_messages.append(f"【{account_name}】\n❌ {error_msg}")
-            if config.config.get("push", "") != "":
-                push_handler = push.PushHandler(config.config["push"])
-                push_handler.push(1, error_msg)
-        else:
-            # 增强对返回值的处理，确保所有可能的情况都被考虑到
-            if run_code == 0:
-                results["ok"].append(i)
-                detailed_messages.append(f"【{account_name}】\n✅ 签到成功\n{run_message}")
-            elif run_code == 1 or run_code == 2:
-                # 处理明确的失败状态
-                results["error"].append(i)
-                detailed_messages.append(f"【{account_name}】\n❌ 签到失败\n{run_message}")
-            elif run_code == 3:
-                results["captcha"].append(i)
-                detailed_messages.append(f"【{account_name}】\n⚠️ 触发验证码\n{run_message}")
-            else:
-                # 其他未知状态归类为未执行
-                results["close"].append(i)
-                detailed_messages.append(f"【{account_name}】\n⏸ 未执行")
-        log.info(f"{i} 执行完毕")
+    Args:
+        config_list (list): 配置文件列表
+        account_results: 与 config_list 顺序一致的 (结果分类, 详细信息) 列表
 
-        time.sleep(random.randint(3, 10))
+    Returns:
+        tuple: (状态码, 推送消息)，推送消息为 ResultList
+    """
+    results = {"ok": [], "close": [], "error": [], "captcha": []}
+    detailed_messages = []  # 存储每个账号的详细签到信息
+
+    for i, (result_key, detail_message) in zip(config_list, account_results):
+        results[result_key].append(i)
+        detailed_messages.append(detail_message)
 
     print("")
     # 生成详细的推送消息
@@ -146,8 +301,12 @@ def main_multi(autorun: bool) -> tuple:
     if len(results["captcha"]) > 0:
         summary += f'，触发验证码 {len(results["captcha"])} 个'
 
-    push_message = summary + '\n\n' + '\n\n'.join(detailed_messages)
+    # 保留每个账号的执行结果，推送时才渲染为文本
+    push_message = ResultList(detailed_messages, header=summary + '\n\n', separator='\n\n')
     log.info(push_message)
+    push_batch.flush()
+    log.info(request.pool_stats.summary())
+    request_metrics.dump()
     # 更清晰的状态码逻辑
     status = 0  # 默认成功
     if len(results["error"]) == len(config_list):
@@ -160,13 +319,79 @@ def main_multi(autorun: bool) -> tuple:
     return status, push_message
 
 
+def main_multi(autorun: bool, workers: int = None) -> tuple:
+    """
+    多用户模式主执行函数
+    
+    执行所有配置文件的任务，并汇总结果
+    
+    Args:
+        autorun (bool): 是否自动运行，False 时会等待用户确认
+        workers (int): 同时执行的账号数量，为 None 时从命令行参数/环境变量读取，1 为依次执行
+    
+    Returns:
+        tuple: (状态码, 推送消息)
+            状态码：
+            0 - 全部成功
+            1 - 全部失败
+            2 - 部分失败
+            3 - 有验证码触发
+    """
+    config_list = prepare_config_list(autorun)
+    if workers is None:
+        workers = get_workers()
+
+    pacers = queue.Queue()
+    if workers > 1 and len(config_list) > 1:
+        log.info(f"并发模式，同时执行 {min(workers, len(config_list))} 个账号")
+        for _ in range(min(workers, len(config_list))):
+            pacers.put(pacing.Pacer())
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="account") as executor:
+            # map 按提交顺序返回结果，汇总信息与依次执行时保持一致
+            account_results = list(executor.map(run_account_paced, config_list, [pacers] * len(config_list)))
+    else:
+        pacers.put(pacing.Pacer())
+        account_results = [run_account_paced(i, pacers) for i in config_list]
+
+    return get_summary(config_list, account_results)
+
+
+async def main_multi_async(autorun: bool, workers: int = None) -> tuple:
+    """
+    多用户模式主执行函数（异步）
+
+    所有账号在同一个事件循环上执行，同时执行的账号数量由 workers 限制，返回值与 main_multi 一致
+    """
+    import asyncio
+
+    config_list = prepare_config_list(autorun)
+    if workers is None:
+        workers = get_workers()
+    log.info(f"异步模式，同时执行 {min(workers, len(config_list))} 个账号")
+    pacers = asyncio.Queue()
+    for _ in range(workers):
+        pacers.put_nowait(pacing.Pacer())
+    try:
+        account_results = await asyncio.gather(*[run_account_async(i, pacers) for i in config_list])
+    finally:
+        # 所有账号共用的异步客户端在事件循环结束前关闭
+        await request.close_shared_async_sessions()
+    return get_summary(config_list, account_results)
+
+
 if __name__ == "__main__":
     if (len(sys.argv) >= 2 and sys.argv[1] == "autorun") or os.getenv("AutoMihoyoBBS_autorun") == "1":
         autorun_flag = True
     else:
         autorun_flag = False
-    task_status, task_push_message = main_multi(autorun_flag)
+    if "--async" in sys.argv or os.getenv("AutoMihoyoBBS_multi_async") == "1":
+        import asyncio
+
+        task_status, task_push_message = asyncio.run(main_multi_async(autorun_flag))
+    else:
+        task_status, task_push_message = main_multi(autorun_flag)
     # 使用 PushHandler 实例，保持与其他推送处理方式一致
     push_handler = push.PushHandler()
     push_handler.push(task_status, task_push_message)
+    push.retry_outbox()
     exit(0)
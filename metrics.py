@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import bisect
+import threading
+import collections
+
+from loghelper import log
+
+# 延迟直方图的桶（秒）
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 这些域名下的接口保留完整路径作为 endpoint，其余域名（推送服务等）的路径里可能带有 token，只记录域名
+api_host_suffix = ("mihoyo.com", "miyoushe.com", "hoyolab.com", "hoyoverse.com")
+
+
+def get_endpoint(url) -> str:
+    """
+    获取请求对应的 endpoint 名称
+
+    :param url: httpx.URL
+    :return: 米哈游接口返回 域名+路径，其他返回域名
+    """
+    host = url.host
+    if host.endswith(api_host_suffix):
+        return f"{host}{url.path}"
+    return host
+
+
+class EndpointMetrics:
+    __slots__ = ("buckets", "latency_sum", "count", "status", "retcode", "retries", "sent_bytes", "received_bytes")
+
+    def __init__(self):
+        self.buckets = [0] * (len(latency_buckets) + 1)
+        self.latency_sum = 0.0
+        self.count = 0
+        self.status = collections.Counter()
+        self.retcode = collections.Counter()
+        self.retries = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "latency_sum": round(self.latency_sum, 6),
+            "latency_buckets": dict(zip([str(i) for i in latency_buckets] + ["+Inf"], self.buckets)),
+            "status": {str(k): v for k, v in self.status.items()},
+            "retcode": {str(k): v for k, v in self.retcode.items()},
+            "retries": self.retries,
+            "sent_bytes": self.sent_bytes,
+            "received_bytes": self.received_bytes,
+        }
+
+
+class RequestMetrics:
+    """
+    http 请求指标，通过 httpx 的事件钩子记录每个 endpoint 的延迟、状态码、retcode、重试次数和流量
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = collections.defaultdict(EndpointMetrics)
+
+    def record_trace(self, endpoint: str, event_name: str) -> None:
+        # HTTPTransport 的 retries 只会重试建立连接，httpcore 会在每次重试时触发 retry 事件
+        if event_name == "connection.retry.started":
+            with self.lock:
+                self.endpoints[endpoint].retries += 1
+
+    def on_request(self, request) -> None:
+        request.extensions["metrics_start"] = time.perf_counter()
+        endpoint = get_endpoint(request.url)
+
+        def trace(event_name, info):
+            self.record_trace(endpoint, event_name)
+
+        request.extensions["trace"] = trace
+
+    def on_response(self, response) -> None:
+        # 钩子在读取响应体之前调用，这里提前读取，调用方随后的 .json() 不会重复读取
+        response.read()
+        self.record(response)
+
+    async def on_request_async(self, request) -> None:
+        request.extensions["metrics_start"] = time.perf_counter()
+        endpoint = get_endpoint(request.url)
+
+        # 异步客户端要求 trace 回调也是协程函数
+        async def trace(event_name, info):
+            self.record_trace(endpoint, event_name)
+
+        request.extensions["trace"] = trace
+
+    async def on_response_async(self, response) -> None:
+        await response.aread()
+        self.record(response)
+
+    def record(self, response) -> None:
+        request = response.request
+        start = request.extensions.get("metrics_start")
+        latency = time.perf_counter() - start if start is not None else 0.0
+        content = response.content
+        retcode = None
+        if content[:1] == b"{":
+            try:
+                retcode = json.loads(content).get("retcode")
+            except ValueError:
+                pass
+        # 供之后的钩子（如限速器）使用，不需要再次解析
+        response.extensions["retcode"] = retcode
+        with self.lock:
+            metrics = self.endpoints[get_endpoint(request.url)]
+            metrics.buckets[bisect.bisect_left(latency_buckets, latency)] += 1
+            metrics.latency_sum += latency
+            metrics.count += 1
+            metrics.status[response.status_code] += 1
+            if retcode is not None:
+                metrics.retcode[retcode] += 1
+            metrics.sent_bytes += int(request.headers.get("content-length", 0))
+            metrics.received_bytes += len(content)
+
+    def get_event_hooks(self, is_async: bool = False) -> dict:
+        if is_async:
+            return {"request": [self.on_request_async], "response": [self.on_response_async]}
+        return {"request": [self.on_request], "response": [self.on_response]}
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {endpoint: metrics.to_dict() for endpoint, metrics in sorted(self.endpoints.items())}
+
+    def to_prometheus(self) -> str:
+        """
+        以 Prometheus 文本格式导出
+        """
+        lines = [
+            "# TYPE mihoyobbs_request_duration_seconds histogram",
+        ]
+        counters = {
+            "mihoyobbs_request_status_total": [],
+            "mihoyobbs_request_retcode_total": [],
+            "mihoyobbs_request_retries_total": [],
+            "mihoyobbs_request_sent_bytes_total": [],
+            "mihoyobbs_request_received_bytes_total": [],
+        }
+        with self.lock:
+            for endpoint, metrics in sorted(self.endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                cumulative = 0
+                for le, count in zip([str(i) for i in latency_buckets] + ["+Inf"], metrics.buckets):
+                    cumulative += count
+                    lines.append(f'mihoyobbs_request_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+                lines.append(f"mihoyobbs_request_duration_seconds_sum{{{label}}} {metrics.latency_sum:.6f}")
+                lines.append(f"mihoyobbs_request_duration_seconds_count{{{label}}} {metrics.count}")
+                for status, count in metrics.status.items():
+                    counters["mihoyobbs_request_status_total"].append(f'{{{label},status="{status}"}} {count}')
+                for retcode, count in metrics.retcode.items():
+                    counters["mihoyobbs_request_retcode_total"].append(f'{{{label},retcode="{retcode}"}} {count}')
+                counters["mihoyobbs_request_retries_total"].append(f"{{{label}}} {metrics.retries}")
+                counters["mihoyobbs_request_sent_bytes_total"].append(f"{{{label}}} {metrics.sent_bytes}")
+                counters["mihoyobbs_request_received_bytes_total"].append(f"{{{label}}} {metrics.received_bytes}")
+        for name, values in counters.items():
+            lines.append(f"# TYPE {name} counter")
+            lines.extend(f"{name}{value}" for value in values)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        with self.lock:
+            count = sum(i.count for i in self.endpoints.values())
+            latency_sum = sum(i.latency_sum for i in self.endpoints.values())
+            slowest = sorted(self.endpoints.items(), key=lambda x: x[1].latency_sum, reverse=True)[:5]
+            lines = [f"共 {count} 次请求，累计耗时 {latency_sum:.2f} 秒"]
+            for endpoint, metrics in slowest:
+                lines.append(f"  {endpoint}: {metrics.count} 次，累计 {metrics.latency_sum:.2f} 秒")
+        return "\n".join(lines)
+
+    def dump(self, file_path: str = None) -> None:
+        """
+        导出指标，文件名以 .json 结尾时导出 JSON，否则导出 Prometheus 文本格式
+
+        :param file_path: 导出路径，默认读取环境变量 AutoMihoyoBBS_metrics_path，未设置时只输出日志
+        """
+        if file_path is None:
+            file_path = os.getenv("AutoMihoyoBBS_metrics_path")
+        log.debug(self.summary())
+        if not file_path:
+            return
+        if file_path.endswith(".json"):
+            content = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        else:
+            content = self.to_prometheus()
+        temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, file_path)
+        except OSError as e:
+            log.warning(f"请求指标导出失败：{e}")
+
+
+request_metrics = RequestMetrics()
@@ -1,13 +1,16 @@
 import tools
 import config
 import setting
-from loghelper import log
-from request import get_new_session
+from context import AccountContext, get_account
+from result import Status, TaskResult, ResultList
+from request import get_shared_async_session
 
 
 class CloudGenshin:
-    def __init__(self, token, lang) -> None:
-        self.http = get_new_session()
+    def __init__(self, token, lang, account: AccountContext = None) -> None:
+        self.account = get_account(account)
+        self.http = self.account.http
+        self.log = self.account.log
         self.headers = {
             'Accept': '*/*',
             'x-rpc-combo_token': token,
@@ -20,35 +23,97 @@ class CloudGenshin:
 
         }
 
-    def sign_account(self) -> str:
-        ret_msg = "云原神:\r\n"
+    def get_done_result(self):
+        """
+        今天已经签到过时直接返回记录的结果，不需要请求接口
+        """
+        ledger = self.account.ledger
+        done_message = ledger.get_done("云原神国际版", ledger.get_token_id(self.headers['x-rpc-combo_token']))
+        if done_message is None:
+            return None
+        self.log.info("云原神今天已经签到过")
+        result = TaskResult("云原神", "云原神:", "\r\n")
+        result.add(None, Status.DONE, done_message)
+        return result
+
+    def save_result(self, result: TaskResult) -> TaskResult:
+        if not result.failed:
+            ledger = self.account.ledger
+            ledger.mark_done("云原神国际版", ledger.get_token_id(self.headers['x-rpc-combo_token']),
+                             result.accounts[-1].message)
+        return result
+
+    def sign_account(self) -> TaskResult:
+        done_result = self.get_done_result()
+        if done_result is not None:
+            return done_result
         req = self.http.get(url=setting.cloud_genshin_sgin_os, headers=self.headers)
-        data = req.json()
+        return self.save_result(self.get_sign_msg(req.json(), req.text, self.account))
+
+    async def sign_account_async(self) -> TaskResult:
+        done_result = self.get_done_result()
+        if done_result is not None:
+            return done_result
+        with self.account.paced():
+            http = get_shared_async_session()
+            req = await http.get(url=setting.cloud_genshin_sgin_os, headers=self.headers)
+        return self.save_result(self.get_sign_msg(req.json(), req.text, self.account))
+
+    @staticmethod
+    def get_sign_msg(data: dict, text: str, account: AccountContext = None) -> TaskResult:
+        """
+        处理签到接口返回的数据
+
+        :param data: 签到接口返回的数据
+        :param text: 签到接口返回的原始文本
+        :param account: 账号上下文，默认为当前账号
+        :return: 签到结果
+        """
+        account = get_account(account)
+        log = account.log
+        ret_msg = ""
         if data['retcode'] == 0:
+            status = Status.SUCCESS
             if int(data["data"]["free_time"]["send_freetime"]) > 0:
                 log.info(f'签到成功，已获得 {data["data"]["free_time"]["send_freetime"]} 分钟免费时长')
                 ret_msg += f'签到成功，已获得 {data["data"]["free_time"]["send_freetime"]} 分钟免费时长\n'
             else:
+                status = Status.DONE
                 log.info('签到失败，未获得免费时长，可能是已经签到过了或者超出免费时长上限')
                 ret_msg += '签到失败，未获得免费时长，可能是已经签到过了或者超出免费时长上限\n'
             ret_msg += f'你当前拥有免费时长 {tools.time_conversion(int(data["data"]["free_time"]["free_time"]))}，' \
                        f'畅玩卡状态为 {data["data"]["play_card"]["short_msg"]}，拥有米云币 {data["data"]["coin"]["coin_num"]} 枚'
-            log.info(ret_msg)
-        elif data['retcode'] == -100:
-            ret_msg = "云原神 token 失效"
-            log.warning(ret_msg)
-            config.clear_cookie_cloudgame_genshin_os()
+            result = TaskResult("云原神", "云原神:", "\r\n")
+            result.add(None, status, ret_msg)
+            log.info(result.render())
+            return result
+        result = TaskResult("云原神", separator="")
+        if data['retcode'] == -100:
+            result.add(None, Status.FAILED, "云原神 token 失效")
+            config.clear_cookie_cloudgame_genshin_os(account.config_ctx, account.log)
         else:
-            ret_msg = f'脚本签到失败，json 文本：{req.text}'
-            log.warning(ret_msg)
-        return ret_msg
+            result.add(None, Status.FAILED, f'脚本签到失败，json 文本：{text}')
+        log.warning(result.render())
+        return result
+
+
+def run_task(account: AccountContext = None) -> ResultList:
+    account = get_account(account)
+    results = ResultList(suffix="\n\n")
+    cg_os = account.config['cloud_games']['os']
+    if not cg_os['genshin']['enable'] or cg_os['genshin']['token'] == "":
+        return results
+    cg_genshin = CloudGenshin(cg_os['genshin']['token'], cg_os['lang'], account)
+    results.append(cg_genshin.sign_account())
+    return results
 
 
-def run_task() -> str:
-    ret_msg = ""
-    cg_os = config.config['cloud_games']['os']
+async def run_task_async(account: AccountContext = None) -> ResultList:
+    account = get_account(account)
+    results = ResultList(suffix="\n\n")
+    cg_os = account.config['cloud_games']['os']
     if not cg_os['genshin']['enable'] or cg_os['genshin']['token'] == "":
-        return ""
-    cg_genshin = CloudGenshin(cg_os['genshin']['token'], cg_os['lang'])
-    ret_msg += cg_genshin.sign_account() + "\n\n"
-    return ret_msg
+        return results
+    cg_genshin = CloudGenshin(cg_os['genshin']['token'], cg_os['lang'], account)
+    results.append(await cg_genshin.sign_account_async())
+    return results
@@ -0,0 +1,141 @@
+import os
+import time
+import sqlite3
+from contextlib import closing
+
+import config
+from cache import cache_path
+from loghelper import log
+
+# 推送失败的消息保存在 cache 目录下，可通过环境变量 AutoMihoyoBBS_push_outbox_path 修改
+outbox_path = os.getenv("AutoMihoyoBBS_push_outbox_path", os.path.join(cache_path, "push_outbox.db"))
+
+# 第 n 次失败后等待 retry_base_delay * 2^(n-1) 秒再重试
+retry_base_delay = 300
+# 最多尝试的次数（包括第一次推送），超过后丢弃
+max_attempts = 6
+# 超过这个时间（秒）仍未推送成功的消息直接丢弃，避免很久以后收到过时的结果
+max_age = 3 * 86400
+# 取出消息后在这段时间（秒）内其他进程不会重复取出，防止同一条消息被重复推送
+claim_timeout = 600
+
+
+class PushOutbox:
+    """
+    推送发件箱，保存推送失败的消息，在之后的运行中按指数退避重试
+
+    使用 SQLite 保存，多个进程（如 server 模式下的多个任务）可以同时读写
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        conn = sqlite3.connect(self.file_path, timeout=30, isolation_level=None)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, config_name TEXT NOT NULL, provider TEXT NOT NULL, "
+            "status INTEGER NOT NULL, message TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL, "
+            "created REAL NOT NULL, next_retry REAL NOT NULL)"
+        )
+        return conn
+
+    def add(self, config_name: str, provider: str, status: int, message: str, error: str = None) -> None:
+        """
+        保存一条推送失败的消息
+
+        :param config_name: 推送配置文件名
+        :param provider: 推送服务名称
+        :param status: 推送状态
+        :param message: 推送内容（已屏蔽关键词）
+        :param error: 失败原因
+        """
+        if config.serverless:
+            return
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT INTO outbox (config_name, provider, status, message, error, attempts, created, next_retry) "
+                    "VALUES (?, ?, ?, ?, ?, 1, ?, ?)",
+                    (config_name, provider, status, message, error, now, now + retry_base_delay),
+                )
+        except (sqlite3.Error, OSError) as e:
+            log.warning(f"推送发件箱保存失败：{e}")
+            return
+        log.info(f"{provider} 推送失败的消息已保存，将在之后重试")
+
+    def claim_due(self) -> list:
+        """
+        取出所有到期需要重试的消息
+
+        :return: [(id, config_name, provider, status, message, attempts, created)]
+        """
+        if config.serverless or not os.path.exists(self.file_path):
+            return []
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, config_name, provider, status, message, attempts, created FROM outbox "
+                    "WHERE next_retry <= ? ORDER BY id", (now,)
+                ).fetchall()
+                conn.executemany("UPDATE outbox SET next_retry = ? WHERE id = ?",
+                                 [(now + claim_timeout, row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def mark_done(self, item_id: int) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM outbox WHERE id = ?", (item_id,))
+
+    def mark_failed(self, item_id: int, attempts: int, error: str = None) -> None:
+        delay = retry_base_delay * 2 ** (attempts - 1)
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE outbox SET attempts = ?, error = ?, next_retry = ? WHERE id = ?",
+                         (attempts, error, time.time() + delay, item_id))
+
+    def retry(self, send) -> int:
+        """
+        重试到期的消息
+
+        :param send: 推送函数，参数为 (config_name, provider, status, message)，返回 (是否成功, 错误信息)
+        :return: 重试成功的消息数量
+        """
+        try:
+            rows = self.claim_due()
+        except (sqlite3.Error, OSError) as e:
+            log.warning(f"推送发件箱读取失败：{e}")
+            return 0
+        if not rows:
+            return 0
+        log.info(f"正在重试 {len(rows)} 条推送失败的消息......")
+        success_count = 0
+        now = time.time()
+        for item_id, config_name, provider, status, message, attempts, created in rows:
+            success, error = send(config_name, provider, status, message)
+            attempts += 1
+            try:
+                if success:
+                    success_count += 1
+                    self.mark_done(item_id)
+                elif error == "timeout":
+                    # 超时的推送可能仍会成功，不再重试，避免重复推送
+                    log.warning(f"{provider} 推送超时，不再重试")
+                    self.mark_done(item_id)
+                elif attempts >= max_attempts or now - created > max_age:
+                    log.warning(f"{provider} 推送已重试 {attempts} 次仍然失败，放弃推送")
+                    self.mark_done(item_id)
+                else:
+                    self.mark_failed(item_id, attempts, error)
+            except (sqlite3.Error, OSError) as e:
+                log.warning(f"推送发件箱更新失败：{e}")
+        return success_count
+
+
+push_outbox = PushOutbox(outbox_path)
@@ -0,0 +1,121 @@
+import time
+import random
+import threading
+import contextlib
+from contextvars import ContextVar
+
+from metrics import api_host_suffix
+
+
+class Pacer:
+    """
+    账号级别的请求节奏控制
+
+    原来的随机等待改为设置“不早于”的时间点，等到该账号发出下一个请求时才真正等待，
+    等待期间其他账号的线程/协程照常执行，最后一次等待之后没有请求时不需要等待
+    """
+
+    def __init__(self):
+        self.not_before = 0.0
+        self.lock = threading.Lock()
+
+    def defer(self, min_seconds: float, max_seconds: float) -> None:
+        """
+        下一个请求至少在 [min_seconds, max_seconds] 之间的随机秒数之后发出
+
+        :param min_seconds: 最少等待的秒数
+        :param max_seconds: 最多等待的秒数
+        """
+        if isinstance(min_seconds, int) and isinstance(max_seconds, int):
+            delay = random.randint(min_seconds, max_seconds)
+        else:
+            delay = random.uniform(min_seconds, max_seconds)
+        with self.lock:
+            self.not_before = max(self.not_before, time.monotonic() + delay)
+
+    def get_delay(self) -> float:
+        with self.lock:
+            return self.not_before - time.monotonic()
+
+    def wait(self) -> None:
+        delay = self.get_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self) -> None:
+        delay = self.get_delay()
+        if delay > 0:
+            import asyncio
+
+            await asyncio.sleep(delay)
+
+
+_default_pacer = Pacer()
+_current_pacer = ContextVar("current_pacer", default=_default_pacer)
+
+
+def get_pacer() -> Pacer:
+    return _current_pacer.get()
+
+
+@contextlib.contextmanager
+def use_pacer(pacer: Pacer):
+    """
+    在当前上下文中使用指定的 Pacer，用法与 config.use_context 相同
+    """
+    token = _current_pacer.set(pacer)
+    try:
+        yield pacer
+    finally:
+        _current_pacer.reset(token)
+
+
+class PacedSession:
+    """
+    在发出请求时使用指定 Pacer 的客户端，请求节奏的钩子读取的是发出请求的账号的 Pacer，
+    没有绑定到当前上下文的账号调用 defer 后，通过该客户端发出的请求同样会等待
+
+    :param session: 实际发出请求的客户端
+    :param pacer: 请求使用的 Pacer
+    """
+
+    def __init__(self, session, pacer: Pacer):
+        self.session = session
+        self.pacer = pacer
+
+    def request(self, method: str, url, **kwargs):
+        with use_pacer(self.pacer):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+def defer(min_seconds: float, max_seconds: float) -> None:
+    """
+    当前账号的下一个请求至少在随机秒数之后发出，代替 time.sleep(random.randint(min_seconds, max_seconds))
+    """
+    get_pacer().defer(min_seconds, max_seconds)
+
+
+def on_request(request) -> None:
+    # 只控制米哈游接口的请求节奏，推送等其他请求不需要等待
+    if request.url.host.endswith(api_host_suffix):
+        get_pacer().wait()
+
+
+async def on_request_async(request) -> None:
+    if request.url.host.endswith(api_host_suffix):
+        await get_pacer().wait_async()
+
+
+def get_event_hooks(is_async: bool = False) -> dict:
+    if is_async:
+        return {"request": [on_request_async]}
+    return {"request": [on_request]}
@@ -1,14 +1,21 @@
 import os
 import re
 import hmac
+import html
 import time
 import base64
 import config
 import urllib
+import atexit
 import hashlib
+import threading
 from datetime import datetime, timezone
-from request import get_new_session, get_new_session_use_proxy
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from request import get_shared_session
+from outbox import push_outbox
+from cache import MtimeCache
 from loghelper import log
+from result import Status, TaskResult, ResultList, account_status_text
 from configparser import ConfigParser, NoOptionError
 
 title = {
@@ -22,6 +29,179 @@ title = {
 }
 
 
+def read_ini(file_path):
+    cfg = ConfigParser()
+    cfg.read(file_path, encoding='utf-8')
+    return cfg
+
+
+def read_text(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        return f.read()
+
+
+# 解析后的推送配置和邮件模板，文件修改后重新读取，解析结果只读，多个 PushHandler 共用
+ini_cache = MtimeCache(read_ini)
+template_cache = MtimeCache(read_text)
+email_template_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets", "email_example.html")
+
+# 邮件随机背景图的缓存时间（秒）
+background_ttl = 600
+_background = {"url": None, "expires": 0}
+_background_lock = threading.Lock()
+
+
+def get_background_url(http):
+    """
+    获取随机背景图，结果缓存 background_ttl 秒，多个线程同时获取时只请求一次
+
+    感谢 @islandwind 提供的随机壁纸api 个人主页：https://space.bilibili.com/7600422
+    """
+    with _background_lock:
+        if _background["url"] and _background["expires"] > time.time():
+            return _background["url"]
+        try:
+            image_url = http.get("https://api.iw233.cn/api.php?sort=random&type=json").json()["pic"][0]
+        except:
+            log.warning("获取随机背景图失败，请检查图片 api")
+            return "unable to get the image"
+        _background["url"] = image_url
+        _background["expires"] = time.time() + background_ttl
+        return image_url
+
+
+def prefetch_background_url(http):
+    """
+    在后台提前获取背景图，发送邮件时不需要再等待
+    """
+    threading.Thread(target=get_background_url, args=(http,), name="push-background", daemon=True).start()
+
+
+# Telegram 消息格式化用到的常量
+telegram_status_emoji = {
+    0: "✅",   # 成功
+    1: "❌",   # 失败
+    2: "⚠️",   # 部分失败
+    3: "🔐",   # 触发验证码
+    -1: "📢",  # 配置更新
+    -2: "❓",  # 错误
+    -99: "🚫"  # 依赖缺失
+}
+# 游戏名称映射到 emoji
+telegram_game_emoji_map = {
+    '原神': '🎮',
+    '星铁': '🚀',
+    '星穹铁道': '🚀',
+    '崩坏3': '⚔️',
+    '崩坏：星穹铁道': '🚀',
+    '绝区零': '🎯',
+    '未定事件簿': '📖',
+    '崩坏学园2': '🎓',
+    '米游社': '🏠',
+    '云原神': '☁️',
+    '云绝区零': '☁️'
+}
+telegram_game_keywords = ('🎮', '🚀', '原神', '星铁', '崩坏')
+telegram_game_indicators = ('🎮', '🚀', '原神：', '星铁：', '崩坏', '绝区零：', '米游社：')
+telegram_error_keywords = ('出错', '失败', '错误', '异常', 'Cookie', 'Stoken')
+telegram_game_split_pattern = re.compile(r'(🎮|🚀)')
+telegram_sign_days_pattern = re.compile(r'签到(\d+)天')
+# 执行结果中每个游戏账号的状态
+telegram_result_emoji = {
+    Status.SUCCESS: "✅",
+    Status.DONE: "☑️",
+    Status.SKIPPED: "⚪",
+    Status.FAILED: "❌",
+    Status.CAPTCHA: "🔐"
+}
+# 直接接收执行结果、自行逐行渲染并屏蔽关键词的推送服务，其他推送服务收到的是渲染并屏蔽关键词后的文本
+record_push_servers = ("telegram",)
+
+
+class SmtpPool:
+    """
+    复用已登录的 SMTP 连接，同一个邮箱账号在进程内只握手和登录一次
+
+    发送前用 NOOP 检查连接是否可用，连接断开时重新连接并重试一次
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        atexit.register(self.close)
+
+    @staticmethod
+    def connect(host, port, ssl_enable, username, password):
+        import smtplib
+
+        if ssl_enable:
+            server = smtplib.SMTP_SSL(host, port)
+        else:
+            server = smtplib.SMTP(host, port)
+        server.login(username, password)
+        return server
+
+    @staticmethod
+    def is_alive(server):
+        import smtplib
+
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def quit(server):
+        import smtplib
+
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def get_entry(self, key):
+        with self.lock:
+            entry = self.connections.get(key)
+            if entry is None:
+                # 每个连接有单独的锁，同一个连接同时只发送一封邮件
+                entry = self.connections[key] = {"lock": threading.Lock(), "server": None}
+            return entry
+
+    def sendmail(self, host, port, ssl_enable, username, password, from_addr, to_addrs, msg):
+        import smtplib
+
+        entry = self.get_entry((host, port, ssl_enable, username, password))
+        with entry["lock"]:
+            server = entry["server"]
+            if server is not None and not self.is_alive(server):
+                self.quit(server)
+                server = None
+            if server is None:
+                server = entry["server"] = self.connect(host, port, ssl_enable, username, password)
+                return server.sendmail(from_addr, to_addrs, msg)
+            try:
+                return server.sendmail(from_addr, to_addrs, msg)
+            except smtplib.SMTPServerDisconnected:
+                log.debug("SMTP 连接已断开，正在重新连接")
+                server = entry["server"] = self.connect(host, port, ssl_enable, username, password)
+                return server.sendmail(from_addr, to_addrs, msg)
+
+    def close(self):
+        """
+        关闭所有连接
+        """
+        with self.lock:
+            connections, self.connections = self.connections, {}
+        for entry in connections.values():
+            with entry["lock"]:
+                if entry["server"] is not None:
+                    self.quit(entry["server"])
+                    entry["server"] = None
+
+
+smtp_pool = SmtpPool()
+
+
 def get_push_title(status_id) -> str:
     """
     获取推送标题
@@ -33,10 +213,11 @@ def get_push_title(status_id) -> str:
 
 class PushHandler:
     def __init__(self, config_file="push.ini"):
-        self.http = get_new_session()
+        self.http = get_shared_session()
         self.cfg = ConfigParser()
         self.config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'config')
         self.config_name = config_file
+        self.results = []
 
     def get_config_path(self):
         file_path = self.config_path
@@ -50,7 +231,7 @@ class PushHandler:
     def load_config(self):
         file_path = self.get_config_path()
         if os.path.exists(file_path):
-            self.cfg.read(file_path, encoding='utf-8')
+            self.cfg = ini_cache.get(file_path)
             return True
         else:
             if self.config_name != "push.ini":
@@ -75,134 +256,176 @@ class PushHandler:
     def telegram(self, status_id, push_message):
         """
         Telegram 推送（支持 HTML 格式化）
+
+        消息边格式化边分段，每凑满一段（Telegram 限制为 4096 字符）就立即发送
         """
         http_proxy = self.cfg.get('telegram', 'http_proxy', fallback=None)
-        session = get_new_session_use_proxy(http_proxy) if http_proxy else self.http
-
-        # 格式化消息内容
-        formatted_message = self._format_telegram_message(status_id, push_message)
-
-        # 检查消息长度，Telegram 限制为 4096 字符
-        if len(formatted_message) > 4096:
-            # 如果超长，分段发送
-            chunks = self._split_telegram_message(formatted_message, 4096)
-            for i, chunk in enumerate(chunks):
-                session.post(
-                    url=f"https://{self.cfg.get('telegram', 'api_url')}/bot{self.cfg.get('telegram', 'bot_token')}/sendMessage",
-                    data={
-                        "chat_id": self.cfg.get('telegram', 'chat_id'),
-                        "text": chunk,
-                        "parse_mode": "HTML"
-                    }
-                )
-                # 避免发送过快
-                if i < len(chunks) - 1:
-                    time.sleep(0.5)
-        else:
+        session = get_shared_session(http_proxy) if http_proxy else self.http
+
+        for i, chunk in enumerate(self.iter_telegram_chunks(status_id, push_message)):
+            # 避免发送过快
+            if i > 0:
+                time.sleep(0.5)
             session.post(
                 url=f"https://{self.cfg.get('telegram', 'api_url')}/bot{self.cfg.get('telegram', 'bot_token')}/sendMessage",
                 data={
                     "chat_id": self.cfg.get('telegram', 'chat_id'),
-                    "text": formatted_message,
+                    "text": chunk,
                     "parse_mode": "HTML"
                 }
             )
 
-    def _format_telegram_message(self, status_id, push_message):
+    def iter_telegram_chunks(self, status_id, push_message, max_length=4096):
         """
-        格式化 Telegram 消息为 HTML 格式
-        """
-        # 获取状态对应的图标
-        status_emoji = {
-            0: "✅",   # 成功
-            1: "❌",   # 失败
-            2: "⚠️",   # 部分失败
-            3: "🔐",   # 触发验证码
-            -1: "📢",  # 配置更新
-            -2: "❓",  # 错误
-            -99: "🚫"  # 依赖缺失
-        }
+        格式化 Telegram 消息并按长度分段
 
-        emoji = status_emoji.get(status_id, "ℹ️")
-        title = get_push_title(status_id)
+        :param status_id: 状态ID
+        :param push_message: 推送内容，ResultList/TaskResult 执行结果逐个任务/账号格式化，不需要先渲染为文本
+        :param max_length: 每段的最大长度
+        :return: 生成器，每次产生一段可以直接发送的 HTML 消息
+        """
+        return self._chunk_lines(self._iter_telegram_lines(status_id, push_message), max_length)
 
-        # 构建 HTML 格式的消息
-        html_message = f"<b>{emoji} {title}</b>\n"
+    def _iter_telegram_lines(self, status_id, push_message):
+        """
+        逐行格式化 Telegram 消息为 HTML 格式
+        """
+        emoji = telegram_status_emoji.get(status_id, "ℹ️")
+        yield f"<b>{emoji} {get_push_title(status_id)}</b>"
+        yield from self._iter_telegram_result(push_message)
+        # 添加底部时间戳
+        yield ""
+        yield "<b>━━━━━━━━━━━━━━━━━━━━</b>"
+        yield f"<i>⏰ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</i>"
 
-        # 处理消息内容
-        lines = push_message.split('\n')
-        formatted_lines = []
+    def _iter_telegram_result(self, result):
+        """
+        按执行结果的字段格式化：账号标题和状态行来自账号名称和状态，游戏标题来自任务名称，
+        每个游戏账号的结果按状态加上图标，只有纯文本的推送内容才按关键词识别
+        """
+        if isinstance(result, TaskResult):
+            yield from self._format_task_result(result)
+        elif isinstance(result, ResultList):
+            if result.name is not None:
+                yield ""
+                yield f"<b>👤 【{html.escape(self.msg_replace(result.name))}】</b>"
+                yield f"<i>{account_status_text.get(result.status, '')}</i>"
+            elif result.header:
+                yield from self._format_text_lines(self.msg_replace(result.header).rstrip('\n').split('\n'))
+            for i in result:
+                if not i:
+                    continue
+                if result.name is not None and isinstance(i, str):
+                    # 账号下的文本是出错等原因的说明
+                    yield f"<i>{html.escape(self.msg_replace(i))}</i>"
+                else:
+                    yield from self._iter_telegram_result(i)
+        else:
+            yield from self._format_text_lines(self.msg_replace(str(result)).split('\n'))
 
-        i = 0
-        in_account_block = False
+    def _format_task_result(self, task):
+        """
+        格式化一个任务（游戏）的执行结果
+        """
+        game_emoji = next((emoji for game, emoji in telegram_game_emoji_map.items() if game in task.name), "📌")
+        yield f"  {game_emoji} <b>{html.escape(task.name)}</b>"
+        for account in task.accounts:
+            lines = [line.strip() for line in self.msg_replace(account.message).split('\n') if line.strip()]
+            if not lines:
+                continue
+            emoji = telegram_result_emoji.get(account.status, "")
+            yield f"      {emoji} <code>{html.escape(lines[0])}</code>"
+            for line in lines[1:]:
+                yield f"      <code>{html.escape(line)}</code>"
 
-        while i < len(lines):
-            line = lines[i].strip()
+    def _format_text_lines(self, lines):
+        """
+        格式化纯文本的推送内容，按关键词识别账号、游戏和状态行
+        """
+        lines = iter(lines)
+        pending = None
+        while True:
+            if pending is not None:
+                line, pending = pending, None
+            else:
+                line = next(lines, None)
+                if line is None:
+                    break
+            line = line.strip()
 
             if not line:
-                formatted_lines.append("")
-                i += 1
+                yield ""
                 continue
 
             # 处理执行概览（📊 开头）
             if line.startswith('📊'):
-                formatted_lines.append(f"\n<b>{line}</b>")
-                i += 1
+                yield f"\n<b>{line}</b>"
                 # 下一行如果是统计信息，也加粗
-                if i < len(lines) and ('成功' in lines[i] or '失败' in lines[i]):
-                    formatted_lines.append(f"<b>{lines[i].strip()}</b>")
-                    i += 1
-                formatted_lines.append("\n<b>━━━━━━━━━━━━━━━━━━━━</b>")
+                next_line = next(lines, None)
+                if next_line is not None and ('成功' in next_line or '失败' in next_line):
+                    yield f"<b>{next_line.strip()}</b>"
+                else:
+                    pending = next_line
+                yield "\n<b>━━━━━━━━━━━━━━━━━━━━</b>"
                 continue
 
             # 检测账号信息行（包含账号名称的行）
             # 匹配模式：账号X、主账号、【xxx】等
-            if any(keyword in line for keyword in ['账号', '【', '】']):
+            if '账号' in line or '【' in line or '】' in line:
+                yield ""  # 空行分隔
                 # 检查是否是单独的账号行，还是包含游戏信息的长行
-                if '🎮' in line or '🚀' in line or '原神' in line or '星铁' in line or '崩坏' in line:
+                if any(keyword in line for keyword in telegram_game_keywords):
                     # 包含游戏信息的复杂行，需要拆分
-                    formatted_lines.append("")  # 空行分隔
-                    account_info = self._format_complex_account_line(line)
-                    formatted_lines.extend(account_info)
+                    yield from self._format_complex_account_line(line)
                 else:
                     # 简单的账号标题行
-                    formatted_lines.append("")
-                    formatted_lines.append(f"<b>👤 {line}</b>")
-                i += 1
+                    yield f"<b>👤 {line}</b>"
                 continue
 
             # 处理游戏签到信息行（🎮 或 🚀 开头，或包含游戏名）
-            if any(indicator in line for indicator in ['🎮', '🚀', '原神：', '星铁：', '崩坏', '绝区零：', '米游社：']):
-                game_info = self._format_game_line(line)
-                formatted_lines.extend(game_info)
-                i += 1
+            if any(indicator in line for indicator in telegram_game_indicators):
+                yield from self._format_game_line(line)
                 continue
 
             # 处理状态行（✅ ❌ ⚠️ 开头）
             if any(emoji in line[:2] for emoji in ['✅', '❌', '⚠️', '⏸']):
-                formatted_lines.append(f"<i>{line}</i>")
-                i += 1
+                yield f"<i>{line}</i>"
                 continue
 
             # 处理错误信息
-            if any(keyword in line for keyword in ['出错', '失败', '错误', '异常', 'Cookie', 'Stoken']):
-                formatted_lines.append(f"<i>⚠️ {line}</i>")
-                i += 1
+            if any(keyword in line for keyword in telegram_error_keywords):
+                yield f"<i>⚠️ {line}</i>"
                 continue
 
             # 其他普通行
-            formatted_lines.append(line)
-            i += 1
-
-        html_message += '\n'.join(formatted_lines)
-
-        # 添加底部时间戳
-        from datetime import datetime
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        html_message += f"\n\n<b>━━━━━━━━━━━━━━━━━━━━</b>"
-        html_message += f"\n<i>⏰ {timestamp}</i>"
+            yield line
 
-        return html_message
+    @staticmethod
+    def _chunk_lines(lines, max_length):
+        """
+        把逐行产生的消息拼成不超过 max_length 的段落，凑满一段就产生一段
+        """
+        parts = []
+        length = -1
+        for text in lines:
+            # 格式化后的一行里可能带有换行
+            for line in text.split('\n'):
+                # 如果单行就超长，强制截断
+                if len(line) > max_length:
+                    if parts:
+                        yield "\n".join(parts)
+                        parts, length = [], -1
+                    for i in range(0, len(line), max_length - 100):
+                        yield line[i:i + max_length - 100]
+                    continue
+                # 检查添加这行是否会超长
+                if length + len(line) + 1 > max_length:
+                    yield "\n".join(parts)
+                    parts, length = [], -1
+                parts.append(line)
+                length += len(line) + 1
+        if parts:
+            yield "\n".join(parts)
 
     def _format_complex_account_line(self, line):
         """
@@ -228,8 +451,7 @@ class PushHandler:
             games_text = line[len(account_name):].strip()
 
         # 分割各个游戏
-        import re
-        game_parts = re.split(r'(🎮|🚀)', games_text)
+        game_parts = telegram_game_split_pattern.split(games_text)
 
         current_game = ""
         for part in game_parts:
@@ -256,25 +478,10 @@ class PushHandler:
         result = []
         line = line.strip()
 
-        # 游戏名称映射到 emoji
-        game_emoji_map = {
-            '原神': '🎮',
-            '星铁': '🚀',
-            '星穹铁道': '🚀',
-            '崩坏3': '⚔️',
-            '崩坏：星穹铁道': '🚀',
-            '绝区零': '🎯',
-            '未定事件簿': '📖',
-            '崩坏学园2': '🎓',
-            '米游社': '🏠',
-            '云原神': '☁️',
-            '云绝区零': '☁️'
-        }
-
         # 检测游戏名称
         game_name = ""
         game_emoji = ""
-        for game, emoji in game_emoji_map.items():
+        for game, emoji in telegram_game_emoji_map.items():
             if game in line:
                 game_name = game
                 game_emoji = emoji
@@ -310,8 +517,7 @@ class PushHandler:
                 # 格式化签到天数
                 if '签到' in details and '天' in details:
                     # 提取签到天数
-                    import re
-                    match = re.search(r'签到(\d+)天', details)
+                    match = telegram_sign_days_pattern.search(details)
                     if match:
                         days = match.group(1)
                         details_before_arrow = details.split('→')[0].strip()
@@ -332,40 +538,6 @@ class PushHandler:
 
         return result
 
-    def _split_telegram_message(self, message, max_length):
-        """
-        将超长消息分割成多个部分
-        """
-        if len(message) <= max_length:
-            return [message]
-
-        chunks = []
-        current_chunk = ""
-        lines = message.split('\n')
-
-        for line in lines:
-            # 如果单行就超长，强制截断
-            if len(line) > max_length:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = ""
-                # 分割超长行
-                for i in range(0, len(line), max_length - 100):
-                    chunks.append(line[i:i + max_length - 100])
-                continue
-
-            # 检查添加这行是否会超长
-            if len(current_chunk) + len(line) + 1 > max_length:
-                chunks.append(current_chunk)
-                current_chunk = line
-            else:
-                current_chunk += ("\n" if current_chunk else "") + line
-
-        if current_chunk:
-            chunks.append(current_chunk)
-
-        return chunks
-
     def ftqq(self, status_id, push_message):
         """
         Server酱推送，具体推送位置在server酱后台配置
@@ -443,22 +615,12 @@ class PushHandler:
             json=data
         )
 
-    # 感谢 @islandwind 提供的随机壁纸api 个人主页：https://space.bilibili.com/7600422
     def smtp(self, status_id, push_message):
         """
         SMTP 电子邮件推送
         """
-        import smtplib
         from email.mime.text import MIMEText
 
-        def get_background_url():
-            try:
-                _image_url = self.http.get("https://api.iw233.cn/api.php?sort=random&type=json").json()["pic"][0]
-            except:
-                _image_url = "unable to get the image"
-                log.warning("获取随机背景图失败，请检查图片 api")
-            return _image_url
-
         def get_background_img_html(background_url):
             if background_url:
                 return f'<img src="{background_url}" alt="background" style="width: 100%; filter: brightness(50%)">'
@@ -472,10 +634,9 @@ class PushHandler:
 
         image_url = None
         if self.cfg.getboolean('smtp', 'background', fallback=True):
-            image_url = get_background_url()
+            image_url = get_background_url(self.http)
 
-        with open("assets/email_example.html", encoding="utf-8") as f:
-            EMAIL_TEMPLATE = f.read()
+        EMAIL_TEMPLATE = template_cache.get(email_template_path)
         message = EMAIL_TEMPLATE.format(title=get_push_title(status_id), message=push_message.replace("\n", "<br/>"),
                                         background_image=get_background_img_html(image_url),
                                         background_info=get_background_img_info(image_url))
@@ -484,13 +645,9 @@ class PushHandler:
         message['Subject'] = smtp_info["subject"]
         message['To'] = smtp_info["toaddr"]
         message['From'] = f"{smtp_info['subject']}<{smtp_info['fromaddr']}>"
-        if self.cfg.getboolean("smtp", "ssl_enable"):
-            server = smtplib.SMTP_SSL(smtp_info["mailhost"], self.cfg.getint("smtp", "port"))
-        else:
-            server = smtplib.SMTP(smtp_info["mailhost"], self.cfg.getint("smtp", "port"))
-        server.login(smtp_info["username"], smtp_info["password"])
-        server.sendmail(smtp_info["fromaddr"], smtp_info["toaddr"], message.as_string())
-        server.close()
+        smtp_pool.sendmail(smtp_info["mailhost"], self.cfg.getint("smtp", "port"),
+                           self.cfg.getboolean("smtp", "ssl_enable"), smtp_info["username"], smtp_info["password"],
+                           smtp_info["fromaddr"], smtp_info["toaddr"], message.as_string())
         log.info("邮件发送成功啦")
 
     def wecom(self, status_id, push_message):
@@ -768,6 +925,47 @@ class PushHandler:
     # 其他推送方法，例如 ftqq, pushplus 等, 和 telegram 方法相似
     # 在类内部直接使用 self.cfg 读取配置
 
+    def send(self, func_name, status, push_message):
+        """
+        调用单个推送服务
+
+        :return: (推送服务名称, 是否成功, 耗时, 错误信息)
+        """
+        func = getattr(self, func_name)
+        if func_name not in record_push_servers:
+            push_message = self.msg_replace(str(push_message))
+        start = time.perf_counter()
+        log.debug(f"推送所用的服务为: {func_name}")
+        try:
+            func(status, push_message)
+        except Exception as e:
+            log.warning(f"{func_name} 推送执行错误：{str(e)}")
+            return func_name, False, time.perf_counter() - start, str(e)
+        log.info(f"{func_name} - 推送完毕......")
+        return func_name, True, time.perf_counter() - start, None
+
+    def send_parallel(self, func_names, status, push_message):
+        """
+        同时调用多个推送服务，总耗时取决于最慢的推送服务
+
+        每个推送服务的超时时间读取该服务配置中的 timeout，未设置时使用 [setting] 中的 push_timeout（默认 60 秒），
+        超时的推送不会被中断，只是不再等待其结果
+        """
+        default_timeout = self.cfg.getfloat('setting', 'push_timeout', fallback=60)
+        executor = ThreadPoolExecutor(max_workers=len(func_names), thread_name_prefix="push")
+        start = time.perf_counter()
+        futures = [(func_name, executor.submit(self.send, func_name, status, push_message)) for func_name in func_names]
+        results = []
+        for func_name, future in futures:
+            timeout = self.cfg.getfloat(func_name, 'timeout', fallback=default_timeout)
+            try:
+                results.append(future.result(timeout=max(0, start + timeout - time.perf_counter())))
+            except FutureTimeoutError:
+                log.warning(f"{func_name} 推送超时（{timeout:g} 秒）")
+                results.append((func_name, False, timeout, "timeout"))
+        executor.shutdown(wait=False)
+        return results
+
     def push(self, status, push_message):
         if not self.load_config():
             return 1
@@ -776,32 +974,104 @@ class PushHandler:
         if self.cfg.getboolean('setting', 'error_push_only', fallback=False) and status == 0:
             return 0
         log.info("正在执行推送......")
-        func_names = self.cfg.get('setting', 'push_server').lower()
-        push_success = True
-        for func_name in func_names.split(","):
-            func = getattr(self, func_name, None)
-            if not func:
+        func_names = []
+        for func_name in self.cfg.get('setting', 'push_server').lower().split(","):
+            if not getattr(self, func_name, None):
                 log.warning(f"推送服务名称错误：{func_name}")
                 continue
-            log.debug(f"推送所用的服务为: {func_name}")
-            try:
-                if not config.update_config_need:
-                    func(status, self.msg_replace(push_message))
-                else:
-                    func(-1,
-                         f'如果您多次收到此消息开头的推送，证明您运行的环境无法自动更新config，请手动更新一下，谢谢\r\n'
-                         f'{title.get(status, "")}\r\n{self.msg_replace(push_message)}')
-            except Exception as e:
-                log.warning(f"{func_name} 推送执行错误：{str(e)}")
+            func_names.append(func_name)
+        if "smtp" in func_names and self.cfg.getboolean('smtp', 'background', fallback=True):
+            prefetch_background_url(self.http)
+        if config.update_config_need:
+            status, push_message = -1, ResultList(
+                [push_message],
+                header=f'如果您多次收到此消息开头的推送，证明您运行的环境无法自动更新config，请手动更新一下，谢谢\r\n'
+                       f'{title.get(status, "")}\r\n'
+            )
+        if len(func_names) > 1 and self.cfg.getboolean('setting', 'push_parallel', fallback=False):
+            self.results = self.send_parallel(func_names, status, push_message)
+        else:
+            self.results = [self.send(func_name, status, push_message) for func_name in func_names]
+        if len(self.results) > 1:
+            log.info("推送结果：" + "，".join(
+                f"{name} {'成功' if success else '失败'}（{elapsed:.2f} 秒）" for name, success, elapsed, _ in self.results))
+        if self.cfg.getboolean('setting', 'outbox', fallback=True):
+            for name, success, _, error in self.results:
+                # 超时的推送可能仍会成功，不再重试，避免重复推送
+                if not success and error != "timeout":
+                    push_outbox.add(self.config_name, name, status, self.msg_replace(str(push_message)), error)
+        return 0 if all(success for _, success, _, _ in self.results) else 1
+
+
+class PushBatch:
+    """
+    合并推送，同一个推送配置文件的多条消息在 flush 时合并为一条推送
+
+    消息过长时由各推送服务自行处理，如 Telegram 会按 4096 字符分段发送
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = {}
+
+    def add(self, config_file, status, push_message):
+        """
+        添加一条待推送的消息
+
+        :param config_file: 推送配置文件名
+        :param status: 推送状态
+        :param push_message: 推送内容
+        """
+        with self.lock:
+            self.messages.setdefault(config_file, []).append((status, push_message))
+
+    def flush(self):
+        """
+        推送所有待推送的消息，每个推送配置文件推送一次
+
+        :return: 全部推送成功返回 0，否则返回 1
+        """
+        with self.lock:
+            messages, self.messages = self.messages, {}
+        push_success = True
+        for config_file, items in messages.items():
+            statuses = {status for status, _ in items}
+            # 状态不一致时按失败推送
+            status = statuses.pop() if len(statuses) == 1 else 1
+            if len(items) > 1:
+                log.info(f"合并推送 {len(items)} 条消息到 {config_file}")
+            if PushHandler(config_file).push(status, ResultList((message for _, message in items), separator="\n\n")) != 0:
                 push_success = False
-                continue
-            log.info(f"{func_name} - 推送完毕......")
         return 0 if push_success else 1
 
 
 def push(status, push_message):
     push_handler_instance = PushHandler()
-    return push_handler_instance.push(status, push_message)
+    result = push_handler_instance.push(status, push_message)
+    retry_outbox()
+    return result
+
+
+def send_outbox_message(config_name, provider, status, push_message):
+    """
+    重新推送发件箱中的一条消息，超时时间与 send_parallel 一致，不会因为推送服务无响应而一直等待
+
+    :return: (是否成功, 错误信息)
+    """
+    handler = PushHandler(config_name)
+    if not handler.load_config():
+        return False, "推送配置文件不存在"
+    if not getattr(handler, provider, None):
+        return False, f"推送服务名称错误：{provider}"
+    _, success, _, error = handler.send_parallel([provider], status, push_message)[0]
+    return success, error
+
+
+def retry_outbox():
+    """
+    重试之前推送失败的消息，在本次推送完成后调用，不影响签到任务的执行
+    """
+    return push_outbox.retry(send_outbox_message)
 
 
 if __name__ == "__main__":
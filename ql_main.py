@@ -6,13 +6,14 @@ import os
 import push
 from loghelper import log
 from error import CookieError
+from metrics import request_metrics
 
 
 def ql_push(status_code, title, message):
     if os.getenv("AutoMihoyoBBS_push_project") == "1":
         push.push(status_code, message)
     else:
-        notify.send(title, message)
+        notify.send(title, str(message))
 
 
 try:
@@ -34,6 +35,7 @@ def single():
         title = "米游社-Cookie错误"
         message = "账号Cookie出错！"
         log.error("账号Cookie有问题！")
+    request_metrics.dump()
     ql_push(status_code, title, message)
 
 
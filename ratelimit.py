@@ -0,0 +1,139 @@
+import os
+import re
+import time
+import threading
+
+from loghelper import log
+
+# 按域名匹配的限速规则：(正则, 每秒请求数, 突发请求数)，按顺序匹配第一条，未匹配的域名不限速
+rate_limit_rules = [
+    (re.compile(r"bbs-api\.miyoushe\.com$"), 1.0, 3),
+    (re.compile(r"cloudgame|(^|-)cg-"), 1.0, 2),
+    (re.compile(r"(mihoyo|miyoushe)\.com$"), 2.0, 5),
+    (re.compile(r"(hoyolab|hoyoverse)\.com$"), 2.0, 5),
+]
+
+# 这些 retcode 表示请求过于频繁或触发风控，与 HTTP 429 一样需要退避
+backoff_retcodes = (1034, -429)
+# 第一次退避的时间（秒），连续触发时翻倍，关闭限速时也作为遇到 429 后的默认等待时间
+backoff_base = 10
+backoff_max = 120
+# 触发退避后速率降低的比例，之后每次成功请求恢复 rate_recover 的比例
+rate_decrease = 0.5
+rate_recover = 0.05
+rate_min_ratio = 0.1
+
+
+class TokenBucket:
+    """
+    令牌桶，触发限流时降低速率并暂停一段时间，之后随着成功的请求逐渐恢复（AIMD）
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.backoff = 0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        预定一个令牌
+
+        :return: 需要等待的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 令牌可以为负数，表示已经被之后的请求预定，等待时间随排队的请求增加
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def on_limited(self) -> float:
+        """
+        触发限流，降低速率并暂停
+
+        :return: 暂停的秒数
+        """
+        with self.lock:
+            self.backoff = min(self.backoff * 2, backoff_max) if self.backoff else backoff_base
+            self.rate = max(self.rate * rate_decrease, self.base_rate * rate_min_ratio)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + self.backoff)
+            return self.backoff
+
+    def on_success(self) -> None:
+        with self.lock:
+            self.backoff = 0
+            if self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * rate_recover)
+
+
+class RateLimiter:
+    """
+    按域名限速，所有账号共用，通过 httpx 的事件钩子在发送请求前等待
+    """
+
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.rules)
+
+    def get_bucket(self, host: str):
+        with self.lock:
+            if host in self.buckets:
+                return self.buckets[host]
+            bucket = None
+            for pattern, rate, burst in self.rules:
+                if pattern.search(host):
+                    bucket = TokenBucket(rate, burst)
+                    break
+            self.buckets[host] = bucket
+            return bucket
+
+    def on_request(self, request) -> None:
+        bucket = self.get_bucket(request.url.host)
+        if bucket is not None:
+            wait = bucket.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
+    async def on_request_async(self, request) -> None:
+        bucket = self.get_bucket(request.url.host)
+        if bucket is not None:
+            wait = bucket.reserve()
+            if wait > 0:
+                import asyncio
+
+                await asyncio.sleep(wait)
+
+    def on_response(self, response) -> None:
+        bucket = self.get_bucket(response.request.url.host)
+        if bucket is None:
+            return
+        # retcode 由 metrics 的响应钩子解析
+        if response.status_code == 429 or response.extensions.get("retcode") in backoff_retcodes:
+            backoff = bucket.on_limited()
+            log.warning(f"{response.request.url.host} 请求过于频繁，{backoff} 秒内暂停请求该域名")
+        elif response.status_code < 400:
+            bucket.on_success()
+
+    async def on_response_async(self, response) -> None:
+        self.on_response(response)
+
+    def get_event_hooks(self, is_async: bool = False) -> dict:
+        if is_async:
+            return {"request": [self.on_request_async], "response": [self.on_response_async]}
+        return {"request": [self.on_request], "response": [self.on_response]}
+
+
+# 设置环境变量 AutoMihoyoBBS_rate_limit=0 关闭限速
+rate_limiter = RateLimiter(rate_limit_rules if os.getenv("AutoMihoyoBBS_rate_limit", "1") != "0" else [])
@@ -1,25 +1,129 @@
 import sys
+import threading
+import weakref
+import collections
+import importlib.util
+from urllib.parse import urlsplit
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 
+import pacing
+from metrics import request_metrics
+from ratelimit import rate_limiter
 
-def get_new_session(**kwargs):
+
+def merge_event_hooks(*hooks_list) -> dict:
+    """
+    合并多组 httpx 事件钩子
+    """
+    event_hooks = {"request": [], "response": []}
+    for hooks in hooks_list:
+        if not hooks:
+            continue
+        for event, funcs in hooks.items():
+            event_hooks[event].extend(funcs)
+    return event_hooks
+
+
+def get_default_event_hooks(event_hooks: dict = None, is_async: bool = False) -> dict:
+    """
+    获取默认的事件钩子：先等待账号的请求节奏和限速再开始计时，响应时先由 metrics 解析 retcode 再交给限速器判断是否需要退避
+    """
+    limiter_hooks = rate_limiter.get_event_hooks(is_async)
+    return merge_event_hooks(pacing.get_event_hooks(is_async), {"request": limiter_hooks["request"]},
+                             request_metrics.get_event_hooks(is_async),
+                             {"response": limiter_hooks["response"]}, event_hooks)
+
+
+class HookURL:
+    """
+    requests 的 url 字符串转为钩子使用的 host/path，与 httpx.URL 的属性一致
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or ""
+        self.path = parts.path
+
+
+class HookRequest:
+    """
+    传给事件钩子的请求，只包含钩子用到的属性
+    """
+
+    def __init__(self, url: str, headers=None):
+        self.url = HookURL(url)
+        self.headers = headers or {}
+        self.extensions = {}
+
+
+class HookResponse:
+    """
+    传给事件钩子的响应，只包含钩子用到的属性
+    """
+
+    def __init__(self, request: HookRequest, response):
+        request.headers = response.request.headers
+        self.request = request
+        self.status_code = response.status_code
+        self.content = response.content
+        self.extensions = {}
+
+    def read(self):
+        return self.content
+
+
+def get_requests_session(event_hooks: dict):
+    """
+    httpx 无法使用时的 requests 客户端，requests 没有请求前的事件钩子，
+    在每次请求前后调用与 httpx 相同的钩子，请求节奏、限速和指标仍然生效
+
+    :param event_hooks: get_default_event_hooks 返回的同步钩子
+    """
+    import requests
+
+    class HookedSession(requests.Session):
+        def request(self, method, url, *args, **kwargs):
+            hook_request = HookRequest(url, kwargs.get("headers"))
+            for hook in event_hooks["request"]:
+                hook(hook_request)
+            response = super().request(method, url, *args, **kwargs)
+            hook_response = HookResponse(hook_request, response)
+            for hook in event_hooks["response"]:
+                hook(hook_response)
+            return response
+
+    return HookedSession()
+
+
+def get_new_session(transport_options: dict = None, **kwargs):
+    """
+    创建新的 http 客户端
+
+    :param transport_options: 传给 httpx.HTTPTransport 的额外参数，如 limits/http2/proxy
+    :param kwargs: 传给 httpx.Client 的额外参数
+    """
+    if transport_options is None:
+        transport_options = {}
+    event_hooks = get_default_event_hooks(kwargs.pop("event_hooks", None))
     try:
         # 优先使用httpx，在httpx无法使用的环境下使用requests
         import httpx
 
-        http_client = httpx.Client(timeout=30, transport=httpx.HTTPTransport(retries=10), follow_redirects=True,
-                                   **kwargs)
+        http_client = httpx.Client(timeout=30, transport=httpx.HTTPTransport(retries=10, **transport_options),
+                                   follow_redirects=True, event_hooks=event_hooks, **kwargs)
         # 当openssl版本小于1.0.2的时候直接进行一个空请求让httpx报错
         import tools
 
         if tools.get_openssl_version() < 102:
             httpx.get()
     except (TypeError, ModuleNotFoundError) as e:
-        import requests
         from requests.adapters import HTTPAdapter
 
-        http_client = requests.Session()
+        http_client = get_requests_session(event_hooks)
         http_client.mount('http://', HTTPAdapter(max_retries=10))
         http_client.mount('https://', HTTPAdapter(max_retries=10))
+        if transport_options.get("proxy"):
+            http_client.proxies = {"http": transport_options["proxy"], "https": transport_options["proxy"]}
     return http_client
 
 
@@ -45,4 +149,223 @@ def get_new_session_use_proxy(http_proxy: str):
         return session
 
 
-http = get_new_session()
+class AsyncSessionWrapper:
+    """
+    httpx 不可用时的异步兼容层，把 requests.Session 的阻塞请求放到线程池里执行
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def request(self, method: str, url: str, **kwargs):
+        import asyncio
+
+        return await asyncio.to_thread(self.session.request, method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+def get_new_async_session(transport_options: dict = None, **kwargs):
+    """
+    创建新的异步 http 客户端
+
+    :param transport_options: 传给 httpx.AsyncHTTPTransport 的额外参数，如 limits/http2/proxy
+    :param kwargs: 传给 httpx.AsyncClient 的额外参数
+    """
+    if transport_options is None:
+        transport_options = {}
+    try:
+        # 与 get_new_session 一致，优先使用httpx，在httpx无法使用的环境下使用requests
+        import httpx
+
+        event_hooks = get_default_event_hooks(kwargs.pop("event_hooks", None), is_async=True)
+        http_client = httpx.AsyncClient(timeout=30,
+                                        transport=httpx.AsyncHTTPTransport(retries=10, **transport_options),
+                                        follow_redirects=True, event_hooks=event_hooks, **kwargs)
+        import tools
+
+        if tools.get_openssl_version() < 102:
+            httpx.get()
+    except (TypeError, ModuleNotFoundError) as e:
+        session = get_new_session()
+        if transport_options.get("proxy"):
+            session.proxies = {"http": transport_options["proxy"], "https": transport_options["proxy"]}
+        http_client = AsyncSessionWrapper(session)
+    return http_client
+
+
+class PoolStats:
+    """
+    按 host 统计共享连接池的请求数和新建连接数
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.connections = collections.Counter()
+        self._streams = {}
+
+    def record_response(self, response) -> None:
+        """
+        httpx 的 response 事件钩子，通过 network_stream 判断本次请求是否复用了已有连接
+        """
+        stream = response.extensions.get("network_stream")
+        host = response.request.url.host
+        with self.lock:
+            self.requests[host] += 1
+            if stream is None:
+                return
+            # 只保存弱引用，连接关闭后自动移除
+            key = id(stream)
+            ref = self._streams.get(key)
+            if ref is None or ref() is not stream:
+                self.connections[host] += 1
+                self._streams[key] = weakref.ref(stream, lambda _, k=key: self._streams.pop(k, None))
+
+    async def record_response_async(self, response) -> None:
+        self.record_response(response)
+
+    def reuse_ratio(self, host: str = None) -> float:
+        """
+        连接复用率，即没有新建连接的请求所占的比例
+
+        :param host: 指定 host，为 None 时统计全部
+        """
+        with self.lock:
+            if host is None:
+                total_requests = sum(self.requests.values())
+                total_connections = sum(self.connections.values())
+            else:
+                total_requests = self.requests[host]
+                total_connections = self.connections[host]
+        if total_requests == 0:
+            return 0.0
+        return 1 - total_connections / total_requests
+
+    def summary(self) -> str:
+        with self.lock:
+            hosts = sorted(self.requests)
+        lines = [f"连接复用率 {self.reuse_ratio():.1%}（{sum(self.requests.values())} 次请求，"
+                 f"新建 {sum(self.connections.values())} 个连接）"]
+        for host in hosts:
+            lines.append(f"  {host}: {self.requests[host]} 次请求，新建 {self.connections[host]} 个连接，"
+                         f"复用率 {self.reuse_ratio(host):.1%}")
+        return "\n".join(lines)
+
+
+pool_stats = PoolStats()
+
+# 共享客户端的连接池参数，httpx 的连接池本身就是按 host 区分的
+shared_pool_limits = {"max_connections": 100, "max_keepalive_connections": 20, "keepalive_expiry": 30}
+
+_shared_sessions = {}
+_shared_sessions_lock = threading.Lock()
+
+
+def get_shared_session(http_proxy: str = None):
+    """
+    获取进程内共享的 http 客户端，相同代理复用同一个连接池
+
+    共享客户端不保存服务器下发的 Cookie，避免多个账号之间串号，Cookie 需要在请求头中显式传入
+
+    :param http_proxy: 代理地址，为 None 时不使用代理
+    """
+    key = http_proxy or ""
+    with _shared_sessions_lock:
+        session = _shared_sessions.get(key)
+        if session is not None:
+            return session
+        transport_options = {}
+        kwargs = {}
+        try:
+            import httpx
+        except ModuleNotFoundError:
+            pass
+        else:
+            transport_options["limits"] = httpx.Limits(**shared_pool_limits)
+            # 安装了 h2 时启用 HTTP/2
+            transport_options["http2"] = importlib.util.find_spec("h2") is not None
+            kwargs["cookies"] = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+            kwargs["event_hooks"] = {"response": [pool_stats.record_response]}
+        if http_proxy:
+            transport_options["proxy"] = f'http://{http_proxy}'
+        session = get_new_session(transport_options, **kwargs)
+        _shared_sessions[key] = session
+        return session
+
+
+# 每个事件循环一组共享的异步客户端，AsyncClient 的连接只能在创建它的事件循环中使用，事件循环结束后随之释放
+_shared_async_sessions = weakref.WeakKeyDictionary()
+
+
+def get_shared_async_session(http_proxy: str = None):
+    """
+    获取当前事件循环内共享的异步 http 客户端，相同代理复用同一个连接池，与 get_shared_session 一致
+
+    调用方不需要关闭，由 close_shared_async_sessions 在事件循环结束前统一关闭
+
+    :param http_proxy: 代理地址，为 None 时不使用代理
+    """
+    import asyncio
+
+    sessions = _shared_async_sessions.setdefault(asyncio.get_running_loop(), {})
+    key = http_proxy or ""
+    session = sessions.get(key)
+    if session is not None:
+        return session
+    transport_options = {}
+    kwargs = {}
+    try:
+        import httpx
+    except ModuleNotFoundError:
+        pass
+    else:
+        transport_options["limits"] = httpx.Limits(**shared_pool_limits)
+        transport_options["http2"] = importlib.util.find_spec("h2") is not None
+        kwargs["cookies"] = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        kwargs["event_hooks"] = {"response": [pool_stats.record_response_async]}
+    if http_proxy:
+        transport_options["proxy"] = f'http://{http_proxy}'
+    session = sessions[key] = get_new_async_session(transport_options, **kwargs)
+    return session
+
+
+async def close_shared_async_sessions() -> None:
+    """
+    关闭当前事件循环内的共享异步客户端
+    """
+    import asyncio
+
+    sessions = _shared_async_sessions.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        await session.aclose()
+
+
+class LazySession:
+    """
+    延迟创建的共享客户端，第一次发起请求时才导入 httpx 并创建连接池
+
+    :param http_proxy: 代理地址，为 None 时不使用代理
+    """
+
+    def __init__(self, http_proxy: str = None):
+        self.http_proxy = http_proxy
+
+    def __getattr__(self, name):
+        return getattr(get_shared_session(self.http_proxy), name)
+
+
+http = LazySession()
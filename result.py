@@ -0,0 +1,122 @@
+from enum import Enum, auto
+
+
+class Status(Enum):
+    SUCCESS = auto()  # 本次执行成功
+    DONE = auto()  # 今天已经完成过
+    SKIPPED = auto()  # 未绑定账号等不需要执行的情况
+    FAILED = auto()
+    CAPTCHA = auto()  # 触发验证码
+
+
+# 多用户模式中每个账号的执行状态在推送中显示的文本
+account_status_text = {
+    Status.SUCCESS: "✅ 签到成功",
+    Status.FAILED: "❌ 签到失败",
+    Status.CAPTCHA: "⚠️ 触发验证码",
+    Status.SKIPPED: "⏸ 未执行",
+}
+
+
+class AccountResult:
+    """
+    单个游戏账号的执行结果
+    """
+    __slots__ = ("name", "status", "message")
+
+    def __init__(self, name, status: Status, message: str):
+        """
+        :param name: 账号名称，任务本身的结果为 None
+        :param status: 执行状态
+        :param message: 推送中显示的信息
+        """
+        self.name = name
+        self.status = status
+        self.message = message
+
+    def __repr__(self):
+        return f"AccountResult({self.name!r}, {self.status.name}, {self.message!r})"
+
+
+class TaskResult:
+    """
+    一个任务（米游社任务、某个游戏的签到）的执行结果，包含该任务下每个账号的结果
+
+    状态在添加结果时就统计好，判断是否失败/触发验证码时不需要解析文本
+    """
+    __slots__ = ("name", "header", "separator", "accounts", "failed", "captcha")
+
+    def __init__(self, name: str, header: str = "", separator: str = "\n"):
+        """
+        :param name: 任务名称
+        :param header: 渲染时的标题
+        :param separator: 渲染时标题和每个账号结果前的分隔符
+        """
+        self.name = name
+        self.header = header
+        self.separator = separator
+        self.accounts = []
+        self.failed = False
+        self.captcha = False
+
+    def add(self, name, status: Status, message: str) -> AccountResult:
+        account = AccountResult(name, status, message)
+        self.accounts.append(account)
+        if status is Status.CAPTCHA:
+            self.captcha = True
+            self.failed = True
+        elif status is Status.FAILED:
+            self.failed = True
+        return account
+
+    def render(self) -> str:
+        """
+        渲染为推送/日志使用的文本
+        """
+        return self.header + "".join(f"{self.separator}{i.message}" for i in self.accounts)
+
+    def __str__(self):
+        return self.render()
+
+
+class ResultList(list):
+    """
+    多个任务的执行结果，渲染时按原来拼接字符串的格式拼接
+
+    空列表视为没有结果，与原来的空字符串一致；设置了账号名称的是多用户模式中一个账号的结果，即使为空也会渲染标题
+    """
+
+    def __init__(self, iterable=(), header: str = "", prefix: str = "", suffix: str = "", separator: str = "",
+                 name: str = None, status: Status = None):
+        """
+        :param header: 渲染时最前面的标题
+        :param prefix: 每个结果前添加的文本
+        :param suffix: 每个结果后添加的文本
+        :param separator: 结果之间的分隔符
+        :param name: 账号名称，多用户模式中一个账号的结果
+        :param status: 该账号的执行状态
+        """
+        super().__init__(iterable)
+        self.header = header
+        self.prefix = prefix
+        self.suffix = suffix
+        self.separator = separator
+        self.name = name
+        self.status = status
+
+    def __bool__(self):
+        return self.name is not None or len(self) > 0
+
+    @property
+    def failed(self) -> bool:
+        return any(i.failed for i in self)
+
+    @property
+    def captcha(self) -> bool:
+        return any(i.captcha for i in self)
+
+    def render(self) -> str:
+        return self.header + self.separator.join(f"{self.prefix}{i}{self.suffix}" for i in self if i)
+
+    def __str__(self):
+        return self.render()
@@ -0,0 +1,160 @@
+import time
+import heapq
+import itertools
+import threading
+
+from loghelper import log
+
+
+class Job:
+    """
+    定时任务，interval（秒）和 cron 表达式二选一
+    """
+
+    def __init__(self, name: str, func, interval: int = None, cron: str = None):
+        self.name = name
+        self.func = func
+        self.interval = None
+        self.cron = None
+        self.version = 0
+        self.next_run = None
+        self.set_trigger(interval, cron)
+
+    def set_trigger(self, interval: int = None, cron: str = None) -> None:
+        if (interval is None) == (cron is None):
+            raise ValueError("interval 和 cron 需要且只能设置一个")
+        if cron is not None:
+            from crontab import CronTab
+
+            self.cron = CronTab(cron)
+            self.interval = None
+        else:
+            if interval <= 0:
+                raise ValueError("interval 必须大于 0")
+            self.interval = interval
+            self.cron = None
+
+    def get_next_run(self, now: float) -> float:
+        if self.cron is not None:
+            return now + self.cron.next(now=now, default_utc=False)
+        return now + self.interval
+
+
+class Scheduler:
+    """
+    基于小根堆的定时任务调度器
+
+    工作线程只在最近的任务到期或任务变动时被唤醒，调整任务时不需要重建线程
+    """
+
+    def __init__(self, name: str = "scheduler"):
+        self.name = name
+        self.jobs = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def _push(self, job: Job, next_run: float) -> None:
+        # 修改任务时旧的堆元素不删除，通过 version 判断是否失效
+        job.version += 1
+        job.next_run = next_run
+        heapq.heappush(self._heap, (next_run, next(self._counter), job.version, job))
+        self._cond.notify()
+
+    def add_job(self, name: str, func, interval: int = None, cron: str = None) -> Job:
+        """
+        添加任务，已存在同名任务时替换
+
+        :param name: 任务名称
+        :param func: 任务函数
+        :param interval: 执行间隔（秒）
+        :param cron: cron 表达式
+        """
+        job = Job(name, func, interval, cron)
+        with self._cond:
+            old_job = self.jobs.get(name)
+            if old_job is not None:
+                old_job.version += 1
+            self.jobs[name] = job
+            self._push(job, job.get_next_run(time.time()))
+        return job
+
+    def reschedule(self, name: str, interval: int = None, cron: str = None) -> Job:
+        """
+        修改任务的执行时间，从当前时间重新开始计算
+        """
+        with self._cond:
+            job = self.jobs[name]
+            job.set_trigger(interval, cron)
+            self._push(job, job.get_next_run(time.time()))
+        return job
+
+    def remove_job(self, name: str) -> None:
+        with self._cond:
+            job = self.jobs.pop(name, None)
+            if job is not None:
+                job.version += 1
+                self._cond.notify()
+
+    def get_next_run(self, name: str):
+        """
+        获取任务下次执行的时间戳，任务不存在时返回 None
+        """
+        with self._cond:
+            job = self.jobs.get(name)
+            return job.next_run if job is not None else None
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(name=self.name, target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, wait: bool = True) -> None:
+        """
+        停止调度器，正在执行的任务会执行完毕
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _get_due_job(self):
+        """
+        等待直到有任务到期，调度器停止时返回 None
+        """
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                next_run, _, version, job = self._heap[0]
+                if version != job.version or self.jobs.get(job.name) is not job:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = next_run - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                # 执行前就计算下一次的时间，任务执行期间也可以被修改
+                self._push(job, job.get_next_run(max(time.time(), next_run)))
+                return job
+            return None
+
+    def _run(self) -> None:
+        while True:
+            job = self._get_due_job()
+            if job is None:
+                log.info("Stopping scheduler")
+                return
+            try:
+                job.func()
+            except Exception as e:
+                log.error(f"任务 {job.name} 执行失败：{e}")
@@ -7,6 +7,8 @@ import threading
 import main as single
 import main_multi as multi
 from loghelper import log
+from metrics import request_metrics
+from scheduler import Scheduler
 
 
 class ServerConfig:
@@ -17,6 +19,7 @@ class ServerConfig:
         self.time_interval = 720  # 默认签到间隔时间，单位分钟
         self.mod = 1  # 单用户模式/自动判断
         self.show_details = False  # 是否显示详细信息
+        self.cron = None  # cron 表达式，设置后代替时间间隔
         self.lock = threading.Lock()  # 线程锁
         
     def set_time_interval(self, interval):
@@ -32,8 +35,29 @@ class ServerConfig:
         with self.lock:
             if isinstance(interval, int) and interval > 0:
                 self.time_interval = interval
+                self.cron = None
                 return True
             return False
+
+    def set_cron(self, cron):
+        """
+        设置 cron 表达式
+        
+        Args:
+            cron (str): cron 表达式
+            
+        Returns:
+            bool: 设置是否成功
+        """
+        from crontab import CronTab
+
+        with self.lock:
+            try:
+                CronTab(cron)
+            except ValueError:
+                return False
+            self.cron = cron
+            return True
             
     def set_mod(self, mod):
         """
@@ -91,22 +115,34 @@ class ServerConfig:
         with self.lock:
             return self.show_details
 
+    def get_trigger(self):
+        """
+        获取签到任务的触发参数
+        
+        Returns:
+            dict: 传给 Scheduler 的 interval（秒）或 cron
+        """
+        with self.lock:
+            if self.cron is not None:
+                return {"cron": self.cron}
+            return {"interval": self.time_interval * 60}
+
 
 class CommandHandler:
     """处理用户命令的类"""
     
-    def __init__(self, config, detal_event, stop_event):
+    def __init__(self, config, detal_event, scheduler):
         """
         初始化命令处理器
         
         Args:
             config: 服务器配置对象
             detal_event: 详细信息显示事件
-            stop_event: 停止服务器事件
+            scheduler: 定时任务调度器
         """
         self.config = config
         self.detal_event = detal_event
-        self.stop_event = stop_event
+        self.scheduler = scheduler
         self.running = True
         
         # 命令帮助信息
@@ -121,6 +157,10 @@ class CommandHandler:
             "add 'yourcookie': add new user with cookie\n"
             "set user attribute value: such set username(*.yaml) enable(attribute) True(value)\n"
             "time x: set interval time (minute)\n"
+            "cron x: set cron expression, such cron 30 9 * * *\n"
+            "schedule user x: run username(*.yaml) with its own cron expression x\n"
+            "unschedule user: remove the schedule of username(*.yaml)\n"
+            "jobs: show all jobs and their next run time\n"
             "show true/false: show the time count\n"
             "help: show this help message"
         )
@@ -162,6 +202,17 @@ class CommandHandler:
                 return None
             elif command == "time":
                 return self._handle_time_command(args)
+            elif command == "cron":
+                return self._handle_cron_command(args)
+            elif command == "schedule":
+                self._handle_schedule_command(args)
+                return None
+            elif command == "unschedule":
+                self._handle_unschedule_command(args)
+                return None
+            elif command == "jobs":
+                self._handle_jobs_command()
+                return None
             elif command == "mod":
                 self._handle_mod_command(args)
                 return None
@@ -243,6 +294,47 @@ class CommandHandler:
             log.info("Invalid time interval. Must be a number.")
             return None
             
+    def _handle_cron_command(self, args):
+        """处理cron命令"""
+        if not args:
+            log.info("Please provide a cron expression.")
+            return None
+        cron = " ".join(args)
+        if self.config.set_cron(cron):
+            log.info(f"Switching schedule to cron '{cron}'")
+            return True  # 需要重新加载配置
+        log.info("Invalid cron expression.")
+        return None
+
+    def _handle_schedule_command(self, args):
+        """处理schedule命令"""
+        if len(args) < 2:
+            log.info("Usage: schedule username cron_expression")
+            return
+        username, cron = args[0], " ".join(args[1:])
+        file_name = f"{username}.yaml"
+        if not multi.account_exists(file_name):
+            log.info("User does not exist")
+            return
+        try:
+            self.scheduler.add_job(f"account:{username}", lambda: run_account(file_name), cron=cron)
+        except ValueError:
+            log.info("Invalid cron expression.")
+            return
+        log.info(f"{username} will run at {format_time(self.scheduler.get_next_run(f'account:{username}'))}")
+
+    def _handle_unschedule_command(self, args):
+        """处理unschedule命令"""
+        if not self._validate_args("unschedule", args, 1):
+            return
+        self.scheduler.remove_job(f"account:{args[0]}")
+        log.info(f"Schedule of {args[0]} removed")
+
+    def _handle_jobs_command(self):
+        """处理jobs命令"""
+        for name in list(self.scheduler.jobs):
+            log.info(f"{name}: next run at {format_time(self.scheduler.get_next_run(name))}")
+
     def _handle_mod_command(self, args):
         """处理mod命令"""
         if not self._validate_args("mod", args, 1):
@@ -284,16 +376,16 @@ class CommandHandler:
         log.info("Adding new user")
         
         if self.config.get_mod() == 1:
-            name = "config"
+            ctx = config.ConfigContext()
         else:
             log.info("Please input your config name (*.yaml):")
-            name = input().strip()
+            # 与 main_multi 读取账号的位置一致，启用账号库时写入账号库
+            ctx = multi.get_config_context(f"{input().strip()}.yaml")
             
         try:
             new_config = config.copy_config()
             new_config['account']['cookie'] = cookie
-            file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config", f"{name}.yaml")
-            config.save_config(file_path, new_config)
+            config.save_config(ctx.config_path, new_config, flush=True, ctx=ctx)
             log.info("Saving OK")
         except Exception as e:
             log.info(f'Saving failed, please check your file system: {e}')
@@ -304,14 +396,16 @@ class CommandHandler:
             return
             
         username, attribute, value = args
-        file_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config", f"{username}.yaml")
+        file_name = f"{username}.yaml"
         
-        if not os.path.exists(file_path):
+        if not multi.account_exists(file_name):
             log.info("User does not exist")
             return
             
+        ctx = multi.get_config_context(file_name)
         try:
-            new_config = config.load_config(file_path)
+            with config.use_context(ctx):
+                new_config = config.load_config()
             
             # 转换值类型
             if value.lower() == "true":
@@ -322,7 +416,7 @@ class CommandHandler:
                 value = int(value)
                 
             new_config[attribute] = value
-            config.save_config(file_path, new_config)
+            config.save_config(ctx.config_path, new_config, flush=True, ctx=ctx)
             log.info("Saving OK")
         except Exception as e:
             log.info(f'Saving failed, please check your file system: {e}')
@@ -369,37 +463,68 @@ def runningtime():
     return int(time.time())
 
 
-def control(config, stop_event):
+def format_time(timestamp):
+    """格式化时间戳"""
+    if timestamp is None:
+        return "-"
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
+def run_sign(config):
     """
-    控制函数，定期执行任务
+    执行签到任务
     
     Args:
         config: 服务器配置对象
-        stop_event: 停止事件
     """
-    last_time = runningtime()
-    while True:
-        now_time = runningtime()
-        if now_time > last_time + config.get_time_interval() * 60:
-            last_time = runningtime()
-            if config.get_mod() == 1:
-                try:
-                    single.task_run()
-                except Exception as e:
-                    log.info(f"single_user start failed: {e}")
-            else:
-                try:
-                    status, push_message = multi.main_multi(True)
-                    push.push(status, push_message)
-                except Exception as e:
-                    log.info(f"multi_user start failed: {e}")
-        if stop_event.is_set():
-            log.info("Stopping threading")
-            break
-        if config.get_show_details():
-            log.info("The Next check time is {}s".format(
-                last_time + config.get_time_interval() * 60 - now_time))
-        time.sleep(20)
+    if config.get_mod() == 1:
+        try:
+            single.task_run()
+        except Exception as e:
+            log.info(f"single_user start failed: {e}")
+    else:
+        try:
+            status, push_message = multi.main_multi(True)
+            push.push(status, push_message)
+        except Exception as e:
+            log.info(f"multi_user start failed: {e}")
+
+
+def run_account(file_name):
+    """
+    执行单个账号的签到任务，供单独设置了 cron 的账号使用
+    
+    Args:
+        file_name (str): 配置文件名
+    """
+    result_key, message = multi.run_account(file_name)
+    multi.push_batch.flush()
+    request_metrics.dump()
+    status = {"ok": 0, "error": 1, "captcha": 3}.get(result_key, 0)
+    push.push(status, message)
+
+
+def control(config, scheduler):
+    """
+    控制函数，按当前的时间设置（重新）安排签到任务
+    
+    Args:
+        config: 服务器配置对象
+        scheduler: 定时任务调度器
+    """
+    if "sign" in scheduler.jobs:
+        scheduler.reschedule("sign", **config.get_trigger())
+    else:
+        scheduler.add_job("sign", lambda: run_sign_and_show(config, scheduler), **config.get_trigger())
+    if config.get_show_details():
+        log.info(f"The Next check time is {format_time(scheduler.get_next_run('sign'))}")
+
+
+def run_sign_and_show(config, scheduler):
+    """执行签到任务，开启详细信息时输出下次执行时间"""
+    run_sign(config)
+    if config.get_show_details():
+        log.info(f"The Next check time is {format_time(scheduler.get_next_run('sign'))}")
 
 
 def command_loop(config):
@@ -410,15 +535,13 @@ def command_loop(config):
         config: 服务器配置对象
     """
     detal = threading.Event()
-    t1_stop = threading.Event()
-    thread1 = threading.Thread(
-        name='time_check',
-        target=control,
-        args=(config, t1_stop)
-    )
-    thread1.start()
+    scheduler = Scheduler(name='time_check')
+    control(config, scheduler)
+    # 定时重试推送失败的消息
+    scheduler.add_job("push_outbox", push.retry_outbox, interval=600)
+    scheduler.start()
     
-    command_handler = CommandHandler(config, detal, t1_stop)
+    command_handler = CommandHandler(config, detal, scheduler)
     
     try:
         while True:
@@ -426,23 +549,13 @@ def command_loop(config):
             result = command_handler.handle_command(command_str)
             
             if result is False:  # 停止服务器
-                t1_stop.set()
                 break
-            elif result is True:  # 重新加载配置
-                t1_stop.set()
-                thread1.join()
-                t1_stop = threading.Event()
-                thread1 = threading.Thread(
-                    name='time_check',
-                    target=control,
-                    args=(config, t1_stop)
-                )
-                thread1.start()
+            elif result is True:  # 重新加载配置，直接修改任务时间，不需要重建线程
+                control(config, scheduler)
     except Exception as e:
         log.info(f"Command loop error: {e}")
-        t1_stop.set()
     finally:
-        thread1.join()
+        scheduler.stop()
 
 
 if __name__ == '__main__':
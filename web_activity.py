@@ -1,14 +1,13 @@
-import time
-import random
 import config
-from request import get_new_session
+import pacing
+from request import get_shared_session
 from loghelper import log
 from datetime import datetime
 
 
 def genshin_mizone():
     """原神脉动联动活动"""
-    client = get_new_session()
+    client = get_shared_session()
     base_url = 'https://act-hk4e-api.mihoyo.com/event/e20250430linkdrink/'
     task_url = f'{base_url}index'
     task_done_url = f'{base_url}claim_task'
@@ -53,14 +52,14 @@ def genshin_mizone():
 
     count = 0
     task_data = get_task_data()
-    time.sleep(random.randint(2, 5))
+    pacing.defer(2, 5)
     for task in task_data['task_infos']:
         if task['status'] == "TS_DONE":
             done_task(task['task_id'])
             count += 1
             if count == 4:
                 break
-            time.sleep(random.randint(1, 3))
+            pacing.defer(1, 3)
             continue
         elif task['status'] == "Task_Limit":
             break